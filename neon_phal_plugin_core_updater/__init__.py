@@ -26,18 +26,69 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import requests
+import re
 
+from concurrent.futures import ThreadPoolExecutor
 from os.path import isfile
-from typing import List
-from datetime import datetime
-from os import close
-from subprocess import Popen
-from tempfile import mkstemp
+from threading import Lock, Thread, Timer
+from time import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+from os import chmod, environ, stat
 from ovos_bus_client.message import Message
 from ovos_utils.log import LOG
 from ovos_plugin_manager.phal import PHALPlugin
 
+from neon_phal_plugin_core_updater.download import download_file, \
+    get_remote_digest
+from neon_phal_plugin_core_updater.http_client import HttpClient
+from neon_phal_plugin_core_updater.journal import UpdateJournal
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.planner import DEFAULT_ESTIMATES, \
+    PLAN_STAGES, plan_update
+from neon_phal_plugin_core_updater.prestage import Prestager
+from neon_phal_plugin_core_updater.release_cache import ReleaseCache, \
+    get_default_cache_path
+from neon_phal_plugin_core_updater.scheduler import UpdateScheduler
+from neon_phal_plugin_core_updater.release_index import GitHubReleaseIndex, \
+    get_default_index_path
+from neon_phal_plugin_core_updater.single_flight import SingleFlight
+from neon_phal_plugin_core_updater.supervisor import ProcessSupervisor, \
+    get_default_update_log_path
+from neon_phal_plugin_core_updater.update_job import UpdateJob, UPDATE_STAGES
+from neon_phal_plugin_core_updater.versions import CHANNELS, parse_version, \
+    select_update
+
+VERSIONS_CONF = "/etc/neon/versions.conf"
+
+
+def _get_metadata_module():
+    """
+    Get `importlib.metadata`, or the `importlib_metadata` backport on
+    Python 3.7
+    """
+    try:
+        import importlib.metadata as metadata
+    except ImportError:
+        import importlib_metadata as metadata
+    return metadata
+
+
+def _get_version_from_filename(filename: str) -> Optional[str]:
+    """
+    Get the version from a wheel or sdist filename
+    @param filename: distribution filename
+    @return: version string, or None if `filename` is not a known format
+    """
+    if filename.endswith(".whl"):
+        parts = filename.split('-')
+        return parts[1] if len(parts) >= 5 else None
+    for ext in (".tar.gz", ".zip"):
+        if filename.endswith(ext):
+            name = filename[:-len(ext)]
+            return name.rsplit('-', 1)[1] if '-' in name else None
+    return None
+
 
 class CoreUpdater(PHALPlugin):
     def __init__(self, bus=None, name="neon-phal-plugin-core-updater",
@@ -46,16 +97,154 @@ class CoreUpdater(PHALPlugin):
         self.update_command = self.config.get("update_command")
         self.core_package = self.config.get("core_module") or "neon_core"
         self.github_ref = self.config.get("github_ref", "NeonGeckoCom/NeonCore")
+        self.github_api_url = self.config.get(
+            "github_api_url", "https://api.github.com").rstrip('/')
         self.pypi_ref = self.config.get("pypi_ref")
+        self.pypi_index_url = self.config.get("pypi_index_url",
+                                              "https://pypi.org")
         self.patch_script = self.config.get("patch_script")
-        self._installed_version = self._get_installed_core_version()
+        self.metrics = UpdaterMetrics()
+        self.metrics_file = self.config.get("metrics_file")
+        self.http = HttpClient(
+            timeout=self.config.get("http_timeout", (5, 30)),
+            max_retries=self.config.get("http_retries", 2),
+            backoff=self.config.get("http_backoff", 0.5),
+            max_retry_wait=self.config.get("http_max_retry_wait", 30),
+            auth_token=self.config.get("github_token"),
+            auth_hosts=(urlparse(self.github_api_url).hostname,),
+            metrics=self.metrics)
+        cache_path = self.config.get("release_cache_path",
+                                     get_default_cache_path())
+        self.release_cache = ReleaseCache(
+            cache_path, ttl=self.config.get("release_cache_ttl", 900),
+            stale_ttl=self.config.get("release_cache_stale_ttl", 3600),
+            session=self.http, metrics=self.metrics)
+        self._release_index = None
+        self._check_flight = SingleFlight()
+        self._results_lock = Lock()
+        self._check_results = dict()
+        self._update_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="core_updater")
+        self.journal = UpdateJournal(self.config.get("update_journal_path"))
+        self.supervisor = ProcessSupervisor(
+            nice=self.config.get("update_nice"),
+            idle_io=self.config.get("update_idle_io", False),
+            kill_timeout=self.config.get("process_kill_timeout", 10),
+            metrics=self.metrics)
+        self.update_log_path = self.config.get("update_log_path",
+                                               get_default_update_log_path())
+        self._job_lock = Lock()
+        self._active_job = None
+        self._launch_timer = None
+        self.update_timeout = self.config.get("update_timeout", 3600)
+        self.max_resume_attempts = self.config.get("update_resume_attempts", 3)
+        self.prestager = None
+        self._prestaging = set()
+        if self.config.get("prestage_updates"):
+            self.prestager = Prestager(
+                directory=self.config.get("prestage_dir"),
+                spec=self.config.get("prestage_spec", "{package}=={version}"),
+                python=self.config.get("prestage_python"),
+                pip_args=self.config.get("prestage_pip_args"),
+                bandwidth_limit=self.config.get("prestage_bandwidth_limit"),
+                nice=self.config.get("prestage_nice", 19),
+                timeout=self.config.get("prestage_timeout", 1800),
+                metrics=self.metrics)
+            self._prestage_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="core_updater_prestage")
+        self._version_lock = Lock()
+        self._version_info = None
+        Thread(target=self._on_startup, daemon=True,
+               name="core_updater_version").start()
         self.bus.on("neon.core_updater.get_version", self.get_core_version)
         self.bus.on("neon.core_updater.check_update", self.check_core_updates)
         self.bus.on("neon.core_updater.start_update", self.start_core_updates)
+        self.bus.on("neon.core_updater.get_metrics", self.get_metrics)
+        self.bus.on("neon.core_updater.get_update_status",
+                    self.get_update_status)
+        self.bus.on("neon.core_updater.cancel_update", self.cancel_core_update)
+        self.scheduler = None
+        if self.config.get("check_interval"):
+            self.scheduler = UpdateScheduler(
+                self._scheduled_check, self.config["check_interval"],
+                jitter=self.config.get("check_jitter"),
+                retry_delay=self.config.get("check_retry_delay", 60),
+                initial_delay=self.config.get("check_initial_delay", 60))
+            self.scheduler.start()
+
+    def shutdown(self):
+        self.bus.remove("neon.core_updater.get_version", self.get_core_version)
+        self.bus.remove("neon.core_updater.check_update",
+                        self.check_core_updates)
+        self.bus.remove("neon.core_updater.start_update",
+                        self.start_core_updates)
+        self.bus.remove("neon.core_updater.get_metrics", self.get_metrics)
+        self.bus.remove("neon.core_updater.get_update_status",
+                        self.get_update_status)
+        self.bus.remove("neon.core_updater.cancel_update",
+                        self.cancel_core_update)
+        if self.scheduler:
+            self.scheduler.stop()
+        if self._launch_timer:
+            self._launch_timer.cancel()
+        self._update_executor.shutdown(wait=False)
+        if self.prestager:
+            self._prestage_executor.shutdown(wait=False)
+        self.http.close()
+        PHALPlugin.shutdown(self)
+
+    @property
+    def _installed_version(self) -> str:
+        """
+        Installed core version, resolved on first use and re-read if the
+        package metadata changes (i.e. the package is reinstalled).
+        """
+        with self._version_lock:
+            if not self._version_info or self._version_changed():
+                self._version_info = (self._get_installed_core_version(),
+                                      *self._get_metadata_stat(), time())
+            return self._version_info[0]
+
+    @_installed_version.setter
+    def _installed_version(self, version: str):
+        with self._version_lock:
+            self._version_info = (version, None, None, float("inf"))
+
+    def _version_changed(self) -> bool:
+        """
+        Check if the installed package metadata changed since the installed
+        version was resolved. A package that was not found is checked again
+        after `version_recheck_interval` seconds.
+        """
+        _, path, mtime, resolved = self._version_info
+        if not path:
+            return time() - resolved > \
+                self.config.get("version_recheck_interval", 60)
+        try:
+            return stat(path).st_mtime_ns != mtime
+        except OSError:
+            return True
+
+    def _get_metadata_stat(self) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Get the path and modification time of the core package metadata
+        @return: metadata path and mtime, or None, None if not found
+        """
+        metadata = _get_metadata_module()
+        try:
+            dist = metadata.distribution(self.core_package)
+            files = [f for f in dist.files or []
+                     if f.name in ("METADATA", "PKG-INFO")]
+            if not files:
+                return None, None
+            path = str(dist.locate_file(files[0]).parent)
+            return path, stat(path).st_mtime_ns
+        except (metadata.PackageNotFoundError, OSError):
+            return None, None
 
     def _get_installed_core_version(self) -> str:
         """
-        Get the currently installed core version at init
+        Get the currently installed core version
         """
         from neon_utils.packaging_utils import get_package_version_spec
         try:
@@ -64,30 +253,135 @@ class CoreUpdater(PHALPlugin):
             LOG.warning(e)
             return "0.0.0"
 
+    def _get_installed_requirements(self) -> Optional[List[str]]:
+        """
+        Get the requirements of the installed core package
+        @return: list of requirement strings, or None if not installed
+        """
+        metadata = _get_metadata_module()
+        try:
+            return metadata.requires(self.core_package) or []
+        except metadata.PackageNotFoundError:
+            return None
+
+    def _get_target_requirements(self, version: str) -> Optional[List[str]]:
+        """
+        Get the requirements of a core version published to PyPI
+        @param version: version to get requirements for
+        @return: list of requirement strings, or None if unknown
+        """
+        if not self.pypi_ref or not version:
+            return None
+        index_url = self.pypi_index_url.rstrip('/')
+        try:
+            info = self.release_cache.get_json(
+                f"{index_url}/pypi/{self.pypi_ref}/{version}/json").get("info")
+        except Exception as e:
+            LOG.warning(f"Failed to get requirements for {version}: {e}")
+            return None
+        if not info or "requires_dist" not in info:
+            return None
+        return info["requires_dist"] or []
+
+    def _plan_update(self, version: str) -> Tuple[str, float]:
+        """
+        Select the cheapest update plan to move from the installed version to
+        `version` and estimate how long it will take.
+        @param version: version to update to
+        @return: plan name, estimated duration in seconds
+        """
+        package_update = bool(self.config.get("package_update_command"))
+        installed_requires = target_requires = None
+        if package_update:
+            installed_requires = self._get_installed_requirements()
+            if installed_requires is not None:
+                target_requires = self._get_target_requirements(version)
+        plan = plan_update(self._installed_version, version,
+                           installed_requires, target_requires,
+                           patch=bool(self.patch_script),
+                           package_update=package_update)
+        return plan, self._estimate_duration(plan)
+
+    def _estimate_duration(self, plan: str) -> float:
+        """
+        Estimate the duration of an update plan as the mean duration of recent
+        completed updates with the same plan, or the configured
+        `update_estimates` if none have completed.
+        @param plan: name of the update plan
+        @return: estimated seconds from update request to completion
+        """
+        durations = self.journal.get_durations().get(plan)
+        if durations:
+            return sum(durations) / len(durations)
+        estimates = self.config.get("update_estimates") or {}
+        return estimates.get(plan, DEFAULT_ESTIMATES[plan])
+
     def _get_latest_github_release(self) -> str:
         """
         Get the latest GitHub release
         """
-        url = f'https://api.github.com/repos/{self.github_ref}/releases/latest'
-        release = requests.get(url).json()
+        url = f'{self.github_api_url}/repos/{self.github_ref}/releases/latest'
+        release = self.release_cache.get_json(url)
         return release.get('tag_name')
 
     def _get_github_releases(self) -> List[str]:
         """
         Get GitHub release names in reverse-chronological order (newest first).
         """
-        default_time = "2000-01-01T00:00:00Z"
-        url = f'https://api.github.com/repos/{self.github_ref}/releases'
-        releases: list = requests.get(url).json()
-        releases.sort(key=lambda r: datetime.strptime(r.get('created_at',
-                                                            default_time),
-                                                      "%Y-%m-%dT%H:%M:%SZ"),
-                      reverse=True)
-        return [r.get('tag_name') for r in releases]
+        if not self._release_index or \
+                self._release_index.github_ref != self.github_ref:
+            self._release_index = GitHubReleaseIndex(
+                self.github_ref, self.config.get(
+                    "release_index_path",
+                    get_default_index_path(self.github_ref)),
+                session=self.http, api_url=self.github_api_url,
+                metrics=self.metrics,
+                ttl=self.config.get("release_cache_ttl", 900))
+        return [r.get('tag_name')
+                for r in self._release_index.get_releases()]
+
+    def _get_pypi_releases(self) -> List[str]:
+        """
+        Get PyPI release versions in reverse-chronological order (newest first)
+        """
+        index_url = self.pypi_index_url.rstrip('/')
+        if self.config.get("pypi_api") == "simple":
+            name = re.sub(r"[-_.]+", "-", self.pypi_ref).lower()
+            project = self.release_cache.get_json(
+                f"{index_url}/simple/{name}/",
+                {"Accept": "application/vnd.pypi.simple.v1+json"})
+            releases = dict()
+            for file in project.get("files", []):
+                version = _get_version_from_filename(file["filename"])
+                if version:
+                    releases.setdefault(version, []).append(
+                        {"yanked": file.get("yanked"),
+                         "upload_time_iso_8601": file.get("upload-time")})
+        else:
+            project = self.release_cache.get_json(
+                f"{index_url}/pypi/{self.pypi_ref}/json")
+            releases = project.get("releases", {})
+        uploaded = dict()
+        for version, files in releases.items():
+            files = [f for f in files if not f.get("yanked")]
+            if files:
+                uploaded[version] = min(f.get("upload_time_iso_8601") or ""
+                                        for f in files)
+        return sorted(uploaded, key=lambda v: uploaded[v], reverse=True)
 
-    def _get_pypi_releases(self):
-        # TODO: Implement package release checks
-        return []
+    def get_metrics(self, message: Message):
+        """
+        Get updater performance metrics
+        @param message: `neon.core_updater.get_metrics` Message
+        """
+        self.bus.emit(message.response({"metrics": self.metrics.to_dict()}))
+
+    def _write_metrics(self):
+        """
+        Write metrics to the configured Prometheus text file, if any
+        """
+        if self.metrics_file:
+            self.metrics.write_prometheus(self.metrics_file)
 
     def get_core_version(self, message: Message):
         """
@@ -99,15 +393,157 @@ class CoreUpdater(PHALPlugin):
 
     def check_core_updates(self, message: Message):
         """
-        Check for a new core version and reply
+        Check for a new core version and reply. Concurrent checks on the same
+        release channel share a single remote lookup and a recent scheduled
+        check result is returned without a remote lookup. If the remote
+        lookup fails, the response has no versions and includes an `error`.
+        """
+        channel = self._get_channel(message.data)
+        result = self._get_warm_result(channel)
+        coalesced = 0
+        if result:
+            LOG.debug(f"Using scheduled check result: {result}")
+        else:
+            try:
+                result, coalesced = self._checked_for_updates(channel)
+            except Exception as e:
+                LOG.error(f"Failed to check for updates: {e}")
+                result = {"new_version": None, "latest_version": None,
+                          "update_plan": None, "estimated_duration": None,
+                          "error": repr(e)}
+        if message:
+            self.bus.emit(message.response({**result,
+                                            "installed_version": self._installed_version,
+                                            "channel": channel,
+                                            "github_ref": self.github_ref,
+                                            "pypi_ref": self.pypi_ref,
+                                            "coalesced_requests": coalesced}))
+
+    def _get_channel(self, data: dict) -> str:
+        """
+        Get the release channel to check. A `channel` in `data` takes priority,
+        then `include_prerelease`, then the configured `update_channel`.
+        @param data: request data
+        @return: `stable`, `beta`, or `alpha`
+        """
+        channel = data.get("channel")
+        if channel not in CHANNELS:
+            if data.get("include_prerelease") is not None:
+                channel = "alpha" if data["include_prerelease"] else "stable"
+            else:
+                channel = self.config.get("update_channel", "stable")
+        return channel if channel in CHANNELS else "stable"
+
+    def _checked_for_updates(self, channel: str) -> Tuple[dict, int]:
+        """
+        Check for updates, sharing any in-flight check, and keep the result.
+        @param channel: release channel to check
+        @return: check result, number of other requests sharing the result
+        """
+        installed_version = self._installed_version
+        self.metrics.increment("update_checks")
+        result, coalesced, leader = self._check_flight.do(
+            (channel, installed_version),
+            lambda: self._timed_check_for_updates(channel))
+        if not leader:
+            LOG.debug("Update check coalesced with an in-flight check")
+            self.metrics.increment("update_checks_coalesced")
+        with self._results_lock:
+            self._check_results[channel] = (installed_version, time(), result)
+        if result.get("new_version"):
+            self._prestage(result["new_version"])
+        return result, coalesced
+
+    def _prestage(self, version: str):
+        """
+        Download packages for `version` in the background, if pre-staging is
+        enabled and `version` is not already staged.
+        @param version: version to stage
+        """
+        if not self.prestager or self.prestager.get_staged_dir(version):
+            return
+        with self._results_lock:
+            if version in self._prestaging:
+                return
+            self._prestaging.add(version)
+
+        def _stage():
+            try:
+                self.prestager.stage(self.pypi_ref or self.core_package,
+                                     version)
+            finally:
+                with self._results_lock:
+                    self._prestaging.discard(version)
+
+        self._prestage_executor.submit(_stage)
+
+    def _timed_check_for_updates(self, channel: str) -> dict:
+        """
+        Check for updates, recording the check duration
+        @param channel: release channel to check
+        @return: check result
+        """
+        try:
+            with self.metrics.timer("update_check"):
+                return self._check_for_updates(channel)
+        except Exception as e:
+            self.metrics.increment("update_check_errors")
+            raise e
+        finally:
+            self._write_metrics()
+
+    def _get_warm_result(self, channel: str) -> Optional[dict]:
+        """
+        Get the result of a recent scheduled check, if one is available
+        @param channel: release channel to get a result for
+        @return: check result if valid for the installed version, else None
+        """
+        if not self.scheduler:
+            return None
+        with self._results_lock:
+            cached = self._check_results.get(channel)
+        if not cached:
+            return None
+        installed_version, timestamp, result = cached
+        if installed_version != self._installed_version or \
+                time() - timestamp > self.scheduler.interval:
+            return None
+        self.metrics.increment("update_checks_warm")
+        return result
+
+    def _scheduled_check(self):
+        """
+        Check for updates and emit `neon.core_updater.update_available` if a
+        new version is found that differs from the previous check.
+        """
+        channel = self._get_channel(
+            {"include_prerelease": self.config.get("include_prerelease")})
+        with self._results_lock:
+            previous = self._check_results.get(channel)
+        result, _ = self._checked_for_updates(channel)
+        if previous and previous[2] == result:
+            return
+        if result.get("new_version"):
+            LOG.info(f"Update available: {result}")
+            self.bus.emit(Message("neon.core_updater.update_available",
+                                  {**result,
+                                   "installed_version": self._installed_version,
+                                   "channel": channel,
+                                   "include_prerelease": channel != "stable",
+                                   "github_ref": self.github_ref,
+                                   "pypi_ref": self.pypi_ref}))
+
+    def _check_for_updates(self, channel: str) -> dict:
+        """
+        Check remote releases for a new core version
+        @param channel: release channel to check
+        @return: dict `new_version` and `latest_version`
         """
         LOG.debug(f"Checking for update. current={self._installed_version}")
-        update_alpha = message.data.get("include_prerelease")
-        new_version = None
-        latest_version = None
+        pin = self.config.get("version_pin")
         if self.pypi_ref:
             releases = self._get_pypi_releases()
-        elif self.github_ref and update_alpha:
+        elif self.github_ref and (channel != "stable" or pin):
             # Get list of latest GH Releases
             releases = self._get_github_releases()
         elif self.github_ref:
@@ -117,81 +553,442 @@ class CoreUpdater(PHALPlugin):
             LOG.error("No remote reference to check for updates")
             releases = []
 
-        for release in releases:
-            if 'a' in release and not update_alpha:
-                # Ignore an alpha release
-                continue
-            elif release == self._installed_version:
-                latest_version = latest_version or release
-                # We Got to the installed version, stop parsing
-                break
-            else:
-                latest_version = latest_version or release
-                new_version = new_version or release
-
+        new_version, latest_version = select_update(
+            releases, self._installed_version, channel, pin)
         if new_version:
             LOG.info(f"Found newer version: {new_version}")
-        if not latest_version and self.github_ref:
+        if not latest_version and self.github_ref and not pin:
             LOG.warning("No release found; get 'latest'")
             latest_version = self._get_latest_github_release()
         LOG.info(f"Got latest version: {latest_version}")
-        if message:
-            self.bus.emit(message.response({"new_version": new_version,
-                                            "latest_version": latest_version,
-                                            "installed_version": self._installed_version,
-                                            "github_ref": self.github_ref,
-                                            "pypi_ref": self.pypi_ref}))
-
-    def start_core_updates(self, message):
-        """
-        Start a core update. Note that the update process may kill this thread.
-        """
-        version = message.data.get("version", "")
-        LOG.debug(f"Starting update to version: {version}")
-        default_branch = "dev" if "a" in version else "master"
-        patch_ver = version.split('a')[0] if version else "master"
-        if self.patch_script:
-            patch_script = self.patch_script.format(patch_ver)
-            patch_script = requests.get(patch_script)
-            if not patch_script.ok:
-                LOG.info(f"No branch for {patch_ver}, trying {default_branch}")
-                patch_ver = default_branch
-                patch_script = \
-                    requests.get(self.patch_script.format(default_branch))
-            if patch_script.ok:
-                LOG.info(f"Running patches from: {patch_script.url}")
-                ref, temp_path = mkstemp()
-                close(ref)
-                with open(temp_path, 'w+') as f:
-                    f.write(patch_script.text)
-                try:
-                    Popen(f"chmod ugo+x {temp_path}", shell=True).wait(10)
-                    LOG.info(f"Running {temp_path}")
-                    patch = Popen([temp_path, patch_ver])
-
-                    LOG.info(f"Patch finished with code: "
-                             f"{patch.wait(timeout=180)}")
-                except Exception as e:
-                    LOG.error(e)
-            else:
-                LOG.error(f"Error getting patch: {patch_script.status_code}")
-                LOG.error(patch_script.text)
-        self.bus.wait_for_response(message.forward("neon.update_config",
-                                                   {"skill_config": False,
-                                                    "apps_config": True,
-                                                    "core_config": True,
-                                                    "restart": False,
-                                                    "version": patch_ver}),
-                                   timeout=30)
-        if self.update_command:
-            branch_spec = version or 'master'
-            LOG.info(f"Starting Core Update to version: {branch_spec}")
-            if isfile("/etc/neon/versions.conf"):
-                LOG.info(f"Writing requested version ({branch_spec}) to config")
-                with open("/etc/neon/versions.conf", 'w') as f:
-                    f.write(f"NEON_CORE_REF={branch_spec}")
-            command = self.update_command.format(version)
-            LOG.debug(command)
-            Popen(command, shell=True, start_new_session=True)
+        plan, estimate = self._plan_update(new_version) if new_version else \
+            (None, None)
+        return {"new_version": new_version,
+                "latest_version": latest_version,
+                "update_plan": plan,
+                "estimated_duration": estimate}
+
+    def start_core_updates(self, message: Message):
+        """
+        Queue a core update and reply with its `job_id`. Update stages run in
+        a worker thread and report `neon.core_updater.progress` events.
+        Only one update may run at a time; while an update is running, the
+        request is rejected with the active job's ID. The update plan is
+        selected automatically unless `plan` is specified in the request, or
+        `force` requests a full update (i.e. to reinstall the same version).
+        Note that the update process may kill the worker thread.
+        @param message: `neon.core_updater.start_update` Message
+        """
+        job = UpdateJob(message.data.get("version", ""), message)
+        job.plan = "full" if message.data.get("force") else \
+            message.data.get("plan")
+        if job.plan and job.plan not in PLAN_STAGES:
+            LOG.error(f"Invalid update plan requested: {job.plan}")
+            self.bus.emit(message.response({"job_id": None,
+                                            "version": job.version,
+                                            "error": "invalid_plan"}))
+            return
+        with self._job_lock:
+            active_job = self._active_job
+            if not active_job:
+                self._active_job = job
+        if active_job:
+            LOG.warning(f"Update already running: {active_job.job_id}")
+            self.bus.emit(message.response({"job_id": None,
+                                            "version": job.version,
+                                            "active_job_id": active_job.job_id,
+                                            "error": "update_in_progress"}))
+            return
+        LOG.debug(f"Queueing update to version: {job.version} ({job.job_id})")
+        self._update_executor.submit(self._run_update_job, job)
+        self.bus.emit(message.response({"job_id": job.job_id,
+                                        "version": job.version}))
+
+    def cancel_core_update(self, message: Message):
+        """
+        Cancel the running update. Remaining stages are not run and any
+        running patch script or update command is stopped.
+        @param message: `neon.core_updater.cancel_update` Message
+        """
+        with self._job_lock:
+            job = self._active_job
+            if job:
+                job.cancelled = True
+        if job:
+            LOG.info(f"Cancelling update: {job.job_id}")
+            # Stopping processes may wait for them to exit
+            Thread(target=self.supervisor.cancel, daemon=True,
+                   name="core_updater_cancel").start()
+        self.bus.emit(message.response({"cancelled": job is not None,
+                                        "job_id": job.job_id if job else None}))
+
+    def _release_job(self, job: UpdateJob):
+        """
+        Allow a new update to start if `job` is the active update
+        """
+        with self._job_lock:
+            if self._active_job is job:
+                self._active_job = None
+
+    def _emit_progress(self, job: UpdateJob, stage: Optional[str],
+                       status: str, duration: Optional[float] = None,
+                       error: Optional[str] = None):
+        """
+        Emit a `neon.core_updater.progress` event for `job`
+        """
+        self.bus.emit(job.message.forward("neon.core_updater.progress",
+                                          {"job_id": job.job_id,
+                                           "version": job.version,
+                                           "plan": job.plan,
+                                           "stage": stage,
+                                           "status": status,
+                                           "duration": duration,
+                                           "elapsed": time() - job.requested,
+                                           "error": error}))
+
+    def _on_startup(self):
+        """
+        Resolve the installed version and finish any journaled update job
+        """
+        installed = self._installed_version
+        data = self.journal.load()
+        if not data:
+            return
+        try:
+            job = UpdateJob.from_dict(data)
+        except Exception as e:
+            LOG.error(f"Ignoring invalid journaled update job: {e}")
+            return
+        if job.status in ("queued", "running") and \
+                job.stages.get("launch_update", {}).get("status") == "started":
+            # The update command may have restarted this process before the
+            # stage result was journaled; don't launch it again
+            LOG.info(f"Update command was launched for {job.version} "
+                     f"({job.job_id})")
+            job.status = "launched"
+            self.journal.save(job.to_dict())
+        if job.status in ("queued", "running") and \
+                job.resume_attempts >= self.max_resume_attempts:
+            LOG.error(f"Update to {job.version} was interrupted "
+                      f"{job.resume_attempts + 1} times ({job.job_id})")
+            job.status = "failed"
+            job.finished = time()
+            self.metrics.increment("update_failed")
+            self.journal.save(job.to_dict())
+            self._emit_status(job)
+            return
+        if job.status in ("queued", "running"):
+            LOG.info(f"Resuming interrupted update to version: {job.version} "
+                     f"({job.job_id})")
+            job.resume_attempts += 1
+            if job.stages.get("run_patch", {}).get("status") == "started":
+                # The patch may have taken this process down; don't run it
+                # again
+                LOG.error(f"Patch was interrupted ({job.job_id})")
+                job.stages["run_patch"] = {"status": "failed",
+                                           "duration": None}
+            if job.patch_path and not isfile(job.patch_path) and \
+                    not job.is_done("run_patch"):
+                job.stages.pop("fetch_patch", None)
+            with self._job_lock:
+                if self._active_job:
+                    return
+                self._active_job = job
+            self._update_executor.submit(self._run_update_job, job)
+        elif job.status == "launched":
+            self._check_launched_job(job, installed)
+
+    def _check_launched_job(self, job: UpdateJob, installed: str):
+        """
+        Resolve the result of a job whose update command was launched, after
+        the command exits or this process is restarted.
+        @param job: journaled UpdateJob with status `launched`
+        @param installed: currently installed core version
+        """
+        target = parse_version(job.version)
+        if not job.version or (target and target == parse_version(installed)):
+            job.status = "completed"
+            self.metrics.observe("update_total", time() - job.requested)
+            self.journal.add_duration(job.plan or "full",
+                                      time() - job.requested)
+            LOG.info(f"Update to {installed} completed in "
+                     f"{time() - job.requested}s ({job.job_id})")
+        elif time() - job.requested > self.update_timeout:
+            job.status = "failed"
+            LOG.error(f"Update to {job.version} did not complete; installed "
+                      f"version is {installed} ({job.job_id})")
         else:
+            LOG.info(f"Waiting for update to {job.version} ({job.job_id})")
+            self._schedule_launch_check(job)
+            return
+        job.finished = time()
+        self.metrics.increment(f"update_{job.status}")
+        self.journal.save(job.to_dict())
+        self._write_metrics()
+        self._emit_status(job)
+
+    def _schedule_launch_check(self, job: UpdateJob):
+        """
+        Check a launched job again once its `update_timeout` has passed, so a
+        failed update is reported even if this process is not restarted.
+        @param job: UpdateJob with status `launched`
+        """
+        if self._launch_timer:
+            self._launch_timer.cancel()
+        delay = max(job.requested + self.update_timeout - time(), 0) + 1
+        self._launch_timer = Timer(delay, self._recheck_launched_job, (job,))
+        self._launch_timer.daemon = True
+        self._launch_timer.start()
+
+    def _recheck_launched_job(self, job: UpdateJob):
+        """
+        Resolve a launched job if it is still the journaled job
+        @param job: UpdateJob with status `launched`
+        """
+        journaled = self.journal.load() or {}
+        if journaled.get("job_id") == job.job_id and \
+                journaled.get("status") == "launched":
+            self._check_launched_job(job, self._installed_version)
+
+    def _emit_status(self, job: UpdateJob):
+        """
+        Emit a `neon.core_updater.update_status` event for `job`
+        """
+        self.bus.emit(job.message.forward("neon.core_updater.update_status",
+                                          job.to_dict()))
+
+    def get_update_status(self, message: Message):
+        """
+        Handle a request for the state of the most recent update job
+        @param message: `neon.core_updater.get_update_status` Message
+        """
+        self.bus.emit(message.response({"job": self.journal.load()}))
+
+    def _run_update_job(self, job: UpdateJob):
+        """
+        Run each update stage of the job's plan in order. A failed stage is
+        reported and the remaining stages are still run. Stages that already
+        finished in an earlier, interrupted run of `job` are skipped.
+        @param job: UpdateJob to run
+        """
+        if not job.plan:
+            try:
+                job.plan = self._plan_update(job.version)[0]
+            except Exception as e:
+                LOG.error(f"Failed to plan update: {e}")
+                job.plan = "full"
+            self.metrics.increment(f"update_plan_{job.plan}")
+        LOG.info(f"Starting {job.plan} update to version: {job.version} "
+                 f"({job.job_id})")
+        job.status = "running"
+        self.journal.save(job.to_dict())
+        for stage in UPDATE_STAGES:
+            if job.cancelled:
+                break
+            if job.is_done(stage):
+                LOG.debug(f"Skipping finished update stage: {stage}")
+                continue
+            if stage not in PLAN_STAGES[job.plan]:
+                job.stages[stage] = {"status": "skipped", "duration": 0.0}
+                self._emit_progress(job, stage, "skipped", 0.0)
+                continue
+            self._emit_progress(job, stage, "started")
+            start = time()
+            error = None
+            try:
+                status = "completed" if getattr(self, f"_stage_{stage}")(job) \
+                    is not False else "skipped"
+            except Exception as e:
+                LOG.error(f"Update stage {stage} failed: {e}")
+                status = "failed"
+                error = repr(e)
+            if job.cancelled:
+                status = "cancelled"
+            duration = time() - start
+            job.stages[stage] = {"status": status, "duration": duration}
+            self.journal.save(job.to_dict())
+            self.metrics.observe(f"stage_{stage}", duration)
+            self.metrics.increment(f"stage_{stage}_{status}")
+            self._emit_progress(job, stage, status, duration, error)
+        self.metrics.observe("update_job", time() - job.requested)
+        job.status = self._get_job_result(job)
+        if job.status != "launched":
+            job.finished = time()
+            self.metrics.increment(f"update_{job.status}")
+        if job.status == "completed":
+            self.journal.add_duration(job.plan, job.finished - job.requested)
+        self.journal.save(job.to_dict())
+        self._write_metrics()
+        self._emit_progress(job, None, "completed" if job.status == "launched"
+                            else job.status, time() - job.requested)
+        if job.finished:
+            self._emit_status(job)
+        if not self.supervisor.running:
+            self._release_job(job)
+
+    @staticmethod
+    def _get_job_result(job: UpdateJob) -> str:
+        """
+        Get the status of a job after its stages have run
+        @param job: UpdateJob that ran
+        @return: `cancelled`, `failed` if any stage in the job's plan failed
+            or a planned update command was not launched, `launched` if the
+            update command was launched, else `completed`
+        """
+        if job.cancelled:
+            return "cancelled"
+        stages = PLAN_STAGES[job.plan]
+        results = {stage: job.stages.get(stage, {}).get("status")
+                   for stage in stages}
+        if "failed" in results.values():
+            return "failed"
+        if "launch_update" in stages:
+            # The new version is confirmed once it is running
+            return "launched" if results["launch_update"] == "completed" \
+                else "failed"
+        return "completed"
+
+    def _on_update_exit(self, job: UpdateJob, code: int):
+        """
+        Handle the update command exiting. A cancelled or failed command ends
+        the job; otherwise the job completes if the new version is installed,
+        or is confirmed by the next startup.
+        @param job: UpdateJob the update command was launched for
+        @param code: update command exit code
+        """
+        self.metrics.set("update_exit_code", code)
+        if job.status == "launched" and (job.cancelled or code != 0):
+            job.status = "cancelled" if job.cancelled else "failed"
+            job.finished = time()
+            self.metrics.increment(f"update_{job.status}")
+            self.journal.save(job.to_dict())
+            self._write_metrics()
+            self._emit_status(job)
+        elif job.status == "launched":
+            self._check_launched_job(job, self._installed_version)
+        self._release_job(job)
+
+    def _stage_fetch_patch(self, job: UpdateJob) -> bool:
+        """
+        Download the patch script for the requested version
+        """
+        if not self.patch_script:
+            return False
+        from requests import HTTPError
+        try:
+            temp_path = self._download_patch(job.patch_ver)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise e
+            LOG.info(f"No branch for {job.patch_ver}, "
+                     f"trying {job.default_branch}")
+            job.patch_ver = job.default_branch
+            temp_path = self._download_patch(job.patch_ver)
+        chmod(temp_path, stat(temp_path).st_mode | 0o111)
+        job.patch_path = temp_path
+        return True
+
+    def _download_patch(self, patch_ver: str) -> str:
+        """
+        Download and verify the patch script for `patch_ver`
+        @param patch_ver: version or branch to get a patch script for
+        @return: path to the downloaded patch script
+        """
+        url = self.patch_script.format(patch_ver)
+        sha256 = self.config.get("patch_script_sha256")
+        if not sha256 and self.config.get("patch_script_sha256_url"):
+            sha256 = get_remote_digest(
+                self.config["patch_script_sha256_url"].format(patch_ver),
+                self.http)
+        temp_path = download_file(
+            url, self.config.get("patch_script_max_size", 1024 * 1024),
+            sha256, self.http, self.metrics)
+        LOG.info(f"Got patches from: {url}")
+        return temp_path
+
+    def _stage_run_patch(self, job: UpdateJob) -> bool:
+        """
+        Run the downloaded patch script. A non-zero exit code fails the stage.
+        """
+        if not job.patch_path:
+            return False
+        LOG.info(f"Running {job.patch_path}")
+        self.metrics.set("patch_exit_code", None)
+        job.stages["run_patch"] = {"status": "started"}
+        self.journal.save(job.to_dict())
+        with self.metrics.timer("patch_runtime"):
+            code = self.supervisor.run(
+                [job.patch_path, job.patch_ver], "patch",
+                timeout=self.config.get("patch_timeout", 180))
+        self.metrics.set("patch_exit_code", code)
+        LOG.info(f"Patch finished with code: {code}")
+        if code != 0:
+            raise RuntimeError(f"Patch exited with code: {code}")
+        return True
+
+    def _stage_update_config(self, job: UpdateJob) -> bool:
+        """
+        Request a configuration update for the patched version
+        """
+        resp = self.bus.wait_for_response(
+            job.message.forward("neon.update_config",
+                                {"skill_config": False,
+                                 "apps_config": True,
+                                 "core_config": True,
+                                 "restart": False,
+                                 "version": job.patch_ver}),
+            timeout=30)
+        if not resp:
+            LOG.warning("No response to config update request")
+            self.metrics.increment("update_config_timeouts")
+        return True
+
+    def _stage_write_versions(self, job: UpdateJob) -> bool:
+        """
+        Write the requested version to the OS versions config
+        """
+        if not self.update_command or not isfile(VERSIONS_CONF):
+            return False
+        LOG.info(f"Writing requested version ({job.branch_spec}) to config")
+        with open(VERSIONS_CONF, 'w') as f:
+            f.write(f"NEON_CORE_REF={job.branch_spec}")
+        return True
+
+    def _stage_launch_update(self, job: UpdateJob) -> bool:
+        """
+        Start the configured update command in a new session. `package` plans
+        use `package_update_command` instead of `update_command`.
+        """
+        update_command = self.config.get("package_update_command") \
+            if job.plan == "package" else self.update_command
+        if not update_command:
             LOG.error(f"Requested update but no command is configured")
+            return False
+        LOG.info(f"Starting Core Update to version: {job.branch_spec}")
+        staged_dir = self.prestager.get_staged_dir(job.version) \
+            if self.prestager else None
+        env = dict(environ)
+        if staged_dir:
+            LOG.info(f"Installing from staged packages: {staged_dir}")
+            env["NEON_UPDATE_WHEEL_DIR"] = staged_dir
+        command = update_command.format(job.version,
+                                        staged_dir=staged_dir or "")
+        LOG.debug(command)
+        LOG.info(f"Writing update output to {self.update_log_path}")
+
+        def _on_exit(code: int):
+            try:
+                self._update_executor.submit(self._on_update_exit, job, code)
+            except RuntimeError:
+                # Executor is shut down
+                pass
+
+        # Journal the launch first; the update command may restart this process
+        job.stages["launch_update"] = {"status": "started"}
+        self.journal.save(job.to_dict())
+        with self.metrics.timer("update_launch"):
+            self.supervisor.start(
+                command, "update", env=env, log_path=self.update_log_path,
+                timeout=self.config.get("update_command_timeout"),
+                on_exit=_on_exit)
+        return True
@@ -0,0 +1,99 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+
+from os import close, remove
+from tempfile import mkstemp
+from typing import Optional
+from ovos_utils.log import LOG
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+
+CHUNK_SIZE = 16 * 1024
+
+
+def get_remote_digest(url: str, session=None) -> str:
+    """
+    Get a SHA-256 digest published at `url`, in `sha256sum` output format or
+    as a bare hex digest.
+    @param url: URL of the digest file
+    @param session: object with a `get` method used for requests
+    @return: lowercase hex digest
+    """
+    import requests
+    resp = (session or requests).get(url)
+    resp.raise_for_status()
+    parts = resp.text.split()
+    if not parts:
+        raise ValueError(f"No digest found at {url}")
+    return parts[0].lower()
+
+
+def download_file(url: str, max_size: int, sha256: Optional[str] = None,
+                  session=None,
+                  metrics: Optional[UpdaterMetrics] = None) -> str:
+    """
+    Stream `url` to a new temporary file, checking its size and digest.
+    The file is removed if the download fails or is invalid.
+    @param url: URL to download
+    @param max_size: max bytes to accept
+    @param sha256: expected hex SHA-256 digest of the file, if any
+    @param session: object with a `get` method used for requests
+    @param metrics: UpdaterMetrics to record downloaded bytes to
+    @return: path to the downloaded file
+    """
+    import requests
+    ref, temp_path = mkstemp()
+    close(ref)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with (session or requests).get(url, stream=True) as resp:
+            resp.raise_for_status()
+            length = resp.headers.get("Content-Length")
+            if length and int(length) > max_size:
+                raise ValueError(f"{url} is {length} bytes (max={max_size})")
+            with open(temp_path, 'wb') as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"{url} exceeds {max_size} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+        if sha256 and digest.hexdigest() != sha256.lower():
+            raise ValueError(f"SHA-256 mismatch for {url}: "
+                             f"expected={sha256} got={digest.hexdigest()}")
+    except Exception as e:
+        remove(temp_path)
+        raise e
+    finally:
+        if metrics:
+            metrics.increment("download_bytes", size)
+    LOG.debug(f"Downloaded {size} bytes from {url} to {temp_path}")
+    return temp_path
@@ -0,0 +1,192 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import sleep, time
+from typing import Collection, Optional, Tuple, Union
+from urllib.parse import urlparse
+from ovos_utils.log import LOG
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    def __init__(self, timeout: Union[float, Tuple[float, float]] = (5, 30),
+                 max_retries: int = 2, backoff: float = 0.5,
+                 max_retry_wait: float = 30, pool_size: int = 4,
+                 auth_token: Optional[str] = None,
+                 auth_hosts: Collection[str] = ("api.github.com",),
+                 metrics: Optional[UpdaterMetrics] = None):
+        """
+        Shared HTTP client with connection pooling, timeouts and retries.
+        @param timeout: default (connect, read) timeout in seconds
+        @param max_retries: max number of retries for a failed request
+        @param backoff: seconds to wait before the first retry; doubled for
+            each following retry unless the server specifies a delay
+        @param max_retry_wait: max seconds to wait before a retry; a response
+            requiring a longer wait is returned without retrying
+        @param pool_size: max connections kept alive per host
+        @param auth_token: optional token sent to `auth_hosts`
+        @param auth_hosts: hostnames to send `auth_token` to
+        @param metrics: UpdaterMetrics to record requests to
+        """
+        self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) \
+            else timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_wait = max_retry_wait
+        self.auth_token = auth_token
+        self.auth_hosts = set(auth_hosts)
+        self.pool_size = pool_size
+        self.metrics = metrics or UpdaterMetrics()
+        self._session = None
+        self._session_lock = Lock()
+
+    @property
+    def session(self):
+        """
+        Pooled `requests.Session`, created on first use
+        """
+        with self._session_lock:
+            if not self._session:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                      pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        with self._session_lock:
+            if self._session:
+                self._session.close()
+                self._session = None
+
+    def get(self, url: str, headers: Optional[dict] = None, **kwargs):
+        """
+        GET `url`, retrying connection errors, server errors and rate-limited
+        responses.
+        @param url: URL to request
+        @param headers: optional request headers
+        @param kwargs: optional kwargs passed to `requests.Session.get`
+        @return: requests.Response object
+        """
+        import requests
+        headers = dict(headers or {})
+        if self.auth_token and urlparse(url).hostname in self.auth_hosts:
+            headers.setdefault("Authorization", f"Bearer {self.auth_token}")
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.metrics.increment("http_requests")
+            try:
+                with self.metrics.timer("http_request"):
+                    resp = self.session.get(url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.increment("http_errors")
+                if attempt >= self.max_retries:
+                    raise e
+                delay = self.backoff * 2 ** attempt
+                LOG.warning(f"Request to {url} failed, retrying in "
+                            f"{delay}s: {e}")
+            else:
+                self._record_response(resp, kwargs.get("stream"))
+                delay = self.get_retry_delay(resp, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    return resp
+                if delay > self.max_retry_wait:
+                    LOG.warning(f"Not retrying {url} ({resp.status_code}); "
+                                f"retry allowed in {delay}s")
+                    return resp
+                LOG.warning(f"Got {resp.status_code} from {url}, retrying "
+                            f"in {delay}s")
+                resp.close()
+            self.metrics.increment("http_retries")
+            attempt += 1
+            sleep(delay)
+
+    def _record_response(self, resp, stream: bool = False):
+        """
+        Record metrics for a response
+        @param resp: requests.Response to record
+        @param stream: if True, the response body has not been read
+        """
+        self.metrics.observe("http_time_to_headers",
+                             resp.elapsed.total_seconds())
+        if not stream:
+            self.metrics.increment("http_bytes", len(resp.content))
+        if resp.status_code == 304:
+            self.metrics.increment("http_not_modified")
+        elif resp.status_code >= 400:
+            self.metrics.increment("http_errors")
+        remaining = resp.headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            try:
+                self.metrics.set("rate_limit_remaining", int(remaining))
+            except ValueError:
+                pass
+            if remaining == "0":
+                self.metrics.increment("http_rate_limited")
+
+    def get_retry_delay(self, resp, attempt: int) -> Optional[float]:
+        """
+        Get the number of seconds to wait before retrying a request
+        @param resp: requests.Response to the previous attempt
+        @param attempt: number of previous retries
+        @return: seconds to wait, or None if the request should not be retried
+        """
+        rate_limited = resp.status_code in (403, 429) and \
+            resp.headers.get("X-RateLimit-Remaining") == "0"
+        if resp.status_code not in RETRY_STATUS and not rate_limited:
+            return None
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(
+                        retry_after).timestamp() - time(), 0)
+                except (TypeError, ValueError):
+                    pass
+        if rate_limited and resp.headers.get("X-RateLimit-Reset"):
+            try:
+                return max(float(resp.headers["X-RateLimit-Reset"]) - time(),
+                           0)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** attempt
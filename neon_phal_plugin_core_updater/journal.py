@@ -0,0 +1,122 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from os import remove
+from os.path import isfile, join, splitext
+from threading import Lock
+from typing import Dict, List, Optional
+from ovos_utils.log import LOG
+from ovos_utils.xdg_utils import xdg_data_home
+
+from neon_phal_plugin_core_updater.util import atomic_write
+
+
+def get_default_journal_path() -> str:
+    """
+    Get the default path to the update job journal
+    """
+    return join(xdg_data_home(), "neon", "core_updater", "update_job.json")
+
+
+class UpdateJournal:
+    def __init__(self, path: Optional[str] = None, max_durations: int = 10):
+        """
+        On-disk record of the most recent update job and of recent update
+        durations for each plan. Each write replaces the file atomically so a
+        crash never leaves a partial record.
+        @param path: path to the journal file
+        @param max_durations: number of durations to keep for each plan
+        """
+        self.path = path or get_default_journal_path()
+        self.durations_path = f"{splitext(self.path)[0]}_durations.json"
+        self.max_durations = max_durations
+        self._lock = Lock()
+
+    def load(self) -> Optional[dict]:
+        """
+        Load the journaled job
+        @return: serialized job, or None if no job is journaled
+        """
+        with self._lock:
+            return self._read(self.path)
+
+    def save(self, job: dict):
+        """
+        Atomically write a job to the journal
+        @param job: serialized job to write
+        """
+        with self._lock:
+            self._write(self.path, job)
+
+    def get_durations(self) -> Dict[str, List[float]]:
+        """
+        Get recent durations of finished updates
+        @return: dict of plan name to durations in seconds, oldest first
+        """
+        with self._lock:
+            return self._read(self.durations_path) or dict()
+
+    def add_duration(self, plan: str, duration: float):
+        """
+        Record the duration of a finished update
+        @param plan: name of the update plan
+        @param duration: seconds from update request to completion
+        """
+        with self._lock:
+            durations = self._read(self.durations_path) or dict()
+            plan_durations = durations.get(plan, []) + [duration]
+            durations[plan] = plan_durations[-self.max_durations:]
+            self._write(self.durations_path, durations)
+
+    @staticmethod
+    def _read(path: str):
+        if not isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            LOG.error(f"Ignoring invalid update journal {path}: {e}")
+            return None
+
+    @staticmethod
+    def _write(path: str, data):
+        try:
+            atomic_write(path, json.dumps(data), sync=True)
+        except Exception as e:
+            LOG.error(f"Failed to write update journal {path}: {e}")
+
+    def clear(self):
+        """
+        Remove the journaled job
+        """
+        with self._lock:
+            if isfile(self.path):
+                remove(self.path)
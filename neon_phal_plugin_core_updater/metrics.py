@@ -0,0 +1,146 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+from ovos_utils.log import LOG
+
+from neon_phal_plugin_core_updater.util import atomic_write
+
+
+class UpdaterMetrics:
+    def __init__(self, prefix: str = "neon_core_updater"):
+        """
+        Thread-safe counters, gauges, and timers for updater operations.
+        @param prefix: prefix for metric names in Prometheus output
+        """
+        self.prefix = prefix
+        self._lock = Lock()
+        self._counters = dict()
+        self._gauges = dict()
+        self._timers = dict()
+
+    def increment(self, name: str, value: float = 1):
+        """
+        Increment a counter
+        @param name: counter name
+        @param value: amount to increment by
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: Optional[float]):
+        """
+        Set a gauge to the specified value
+        @param name: gauge name
+        @param value: new gauge value
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """
+        Record a duration
+        @param name: timer name
+        @param seconds: observed duration in seconds
+        """
+        with self._lock:
+            timer = self._timers.setdefault(name, {"count": 0, "sum": 0.0,
+                                                   "max": 0.0, "last": 0.0})
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            timer["last"] = seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Context manager recording the duration of its block, including any
+        raised exception.
+        @param name: timer name
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start)
+
+    def get_timer(self, name: str) -> Optional[dict]:
+        """
+        Get a copy of the recorded values for a timer
+        @param name: timer name
+        @return: dict count, sum, max, and last, or None if not recorded
+        """
+        with self._lock:
+            timer = self._timers.get(name)
+            return dict(timer) if timer else None
+
+    def to_dict(self) -> dict:
+        """
+        Get a serializable snapshot of all metrics
+        """
+        with self._lock:
+            return {"counters": dict(self._counters),
+                    "gauges": dict(self._gauges),
+                    "timers": {k: dict(v) for k, v in self._timers.items()}}
+
+    def to_prometheus(self) -> str:
+        """
+        Get all metrics in the Prometheus text exposition format
+        """
+        metrics = self.to_dict()
+        lines = list()
+        for name, value in sorted(metrics["counters"].items()):
+            name = f"{self.prefix}_{name}_total"
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, value in sorted(metrics["gauges"].items()):
+            if value is None:
+                continue
+            name = f"{self.prefix}_{name}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        for name, timer in sorted(metrics["timers"].items()):
+            name = f"{self.prefix}_{name}_seconds"
+            lines += [f"# TYPE {name} summary",
+                      f"{name}_count {timer['count']}",
+                      f"{name}_sum {timer['sum']}",
+                      f"# TYPE {name}_max gauge",
+                      f"{name}_max {timer['max']}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """
+        Atomically write metrics to a Prometheus text file (i.e. for the
+        node_exporter textfile collector)
+        @param path: path to write to
+        """
+        try:
+            atomic_write(path, self.to_prometheus(), mode=0o644)
+        except Exception as e:
+            LOG.error(f"Failed to write metrics to {path}: {e}")
@@ -0,0 +1,288 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import hashlib
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv
+from threading import Lock, Thread
+from time import time
+from typing import Collection, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from ovos_utils.log import LOG
+
+from neon_phal_plugin_core_updater.http_client import HttpClient
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.single_flight import SingleFlight
+
+PASSTHROUGH_HEADERS = ("Content-Type", "Link")
+
+
+class ReleaseMirror:
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080,
+                 github_url: str = "https://api.github.com",
+                 pypi_url: str = "https://pypi.org", ttl: float = 900,
+                 raw_hosts: Collection[str] = ("raw.githubusercontent.com",
+                                               "github.com"),
+                 http: Optional[HttpClient] = None,
+                 github_refs: Collection[str] = ("NeonGeckoCom/NeonCore",),
+                 max_entries: int = 1024):
+        """
+        HTTP service caching the GitHub and PyPI release APIs and patch scripts
+        for devices on a local network. Devices use this as their
+        `github_api_url` and `pypi_index_url`, and request files from
+        allowed hosts at `/raw/<host>/<path>`.
+        @param host: address to listen on
+        @param port: port to listen on (0 to select a free port)
+        @param github_url: upstream GitHub API URL
+        @param pypi_url: upstream PyPI URL
+        @param ttl: seconds to serve cached responses before revalidating
+        @param raw_hosts: hosts that files may be requested from
+        @param http: HttpClient for upstream requests
+        @param github_refs: GitHub repositories (`owner/repo`) that may be
+            requested at `/repos/<owner>/<repo>/...`
+        @param max_entries: max number of responses to cache; the least
+            recently used response is evicted first
+        """
+        self.github_url = github_url.rstrip('/')
+        self.pypi_url = pypi_url.rstrip('/')
+        self.ttl = ttl
+        self.raw_hosts = set(raw_hosts)
+        self.github_refs = {ref.strip('/').lower() for ref in github_refs}
+        self.metrics = UpdaterMetrics()
+        self.http = http or HttpClient(metrics=self.metrics)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self._flight = SingleFlight()
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mirror.handle(self)
+
+            def log_message(self, format, *args):
+                LOG.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_port
+
+    def start(self):
+        """
+        Serve requests in a background thread
+        """
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def serve_forever(self):
+        """
+        Serve requests until interrupted
+        """
+        LOG.info(f"Serving release mirror on port {self.port}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.http.close()
+
+    def get_upstream_url(self, path: str) -> Optional[str]:
+        """
+        Get the upstream URL for a request path
+        @param path: request path, including any query
+        @return: upstream URL, or None if the path is not mirrored
+        """
+        segments = unquote(path.split('?')[0]).split('/')
+        if any(segment in ('.', '..') for segment in segments):
+            # Upstream URLs are normalized, so these could escape the
+            # allowed repositories and hosts
+            return None
+        if path.startswith("/repos/"):
+            owner, repo = (segments[2:] + ['', ''])[:2]
+            if f"{owner}/{repo}".lower() in self.github_refs:
+                return f"{self.github_url}{path}"
+            return None
+        if path.startswith("/pypi/") or path.startswith("/simple/"):
+            return f"{self.pypi_url}{path}"
+        if path.startswith("/raw/"):
+            host, _, file_path = path[len("/raw/"):].partition('/')
+            if host in self.raw_hosts:
+                return f"https://{host}/{file_path}"
+        return None
+
+    def get(self, url: str, accept: Optional[str] = None) -> Tuple[int, dict,
+                                                                   bytes]:
+        """
+        Get a cached upstream response, fetching or revalidating it if the
+        cache has expired. Concurrent requests for the same URL share one
+        upstream request and stale data is served if the upstream fails.
+        @param url: upstream URL
+        @param accept: optional Accept header to send upstream
+        @return: status code, headers, body
+        """
+        key = (url, accept)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry:
+                self._cache.move_to_end(key)
+        if entry and time() - entry["fetched"] < self.ttl:
+            self.metrics.increment("cache_hits")
+            return entry["status"], entry["headers"], entry["body"]
+        self.metrics.increment("cache_misses")
+        return self._flight.do(key, lambda: self._fetch(key, entry))[0]
+
+    def _fetch(self, key: tuple, entry: Optional[dict]) -> Tuple[int, dict,
+                                                                 bytes]:
+        """
+        Request `key` from upstream, revalidating `entry` if available.
+        Successful and not found responses are cached.
+        """
+        url, accept = key
+        headers = {"Accept": accept} if accept else {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        try:
+            resp = self.http.get(url, headers=headers)
+        except Exception as e:
+            if entry:
+                LOG.warning(f"Upstream request failed, serving stale: {e}")
+                return entry["status"], entry["headers"], entry["body"]
+            raise e
+        if resp.status_code == 304 and entry:
+            entry["fetched"] = time()
+        elif resp.ok or resp.status_code == 404:
+            entry = {"status": 200 if resp.ok else 404,
+                     "etag": resp.headers.get("ETag"), "fetched": time(),
+                     "body": resp.content,
+                     "headers": {k: resp.headers[k]
+                                 for k in PASSTHROUGH_HEADERS
+                                 if k in resp.headers}}
+            entry["headers"]["ETag"] = \
+                f'"{hashlib.sha256(resp.content).hexdigest()}"'
+        elif entry:
+            LOG.warning(f"Got {resp.status_code} from {url}, serving stale")
+            return entry["status"], entry["headers"], entry["body"]
+        else:
+            return resp.status_code, \
+                {"Content-Type": resp.headers.get("Content-Type",
+                                                  "application/json")}, \
+                resp.content
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.metrics.increment("cache_evictions")
+        return entry["status"], entry["headers"], entry["body"]
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        """
+        Handle a GET request
+        """
+        self.metrics.increment("requests")
+        url = self.get_upstream_url(handler.path)
+        if not url:
+            return self._send(handler, 404, {}, b'{"message": "Not Found"}')
+        accept = handler.headers.get("Accept") \
+            if handler.path.startswith("/simple/") else None
+        try:
+            status, headers, body = self.get(url, accept)
+        except Exception as e:
+            LOG.error(f"Failed to get {url}: {e}")
+            return self._send(handler, 502, {}, b'{"message": "Bad Gateway"}')
+        headers = dict(headers)
+        if "Link" in headers:
+            # Point pagination links at this mirror
+            base = f"http://{handler.headers.get('Host')}"
+            upstream = urlsplit(url)
+            headers["Link"] = headers["Link"].replace(
+                f"{upstream.scheme}://{upstream.netloc}", base)
+        if status == 200 and \
+                handler.headers.get("If-None-Match") == headers.get("ETag"):
+            return self._send(handler, 304, {"ETag": headers["ETag"]}, b"")
+        self._send(handler, status, headers, body)
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, headers: dict,
+              body: bytes):
+        handler.send_response(status)
+        for key, val in headers.items():
+            handler.send_header(key, val)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def main(args: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        description="Serve a caching mirror of core release information")
+    parser.add_argument("--host", default="0.0.0.0",
+                        help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="Port to listen on")
+    parser.add_argument("--ttl", type=float, default=900,
+                        help="Seconds to cache upstream responses")
+    parser.add_argument("--max-entries", type=int, default=1024,
+                        help="Max number of upstream responses to cache")
+    parser.add_argument("--github-url", default="https://api.github.com",
+                        help="Upstream GitHub API URL")
+    parser.add_argument("--pypi-url", default="https://pypi.org",
+                        help="Upstream PyPI URL")
+    parser.add_argument("--github-ref", action="append",
+                        help="GitHub repository (owner/repo) to mirror "
+                             "(may be repeated; default "
+                             "NeonGeckoCom/NeonCore)")
+    parser.add_argument("--raw-host", action="append",
+                        help="Host that files may be requested from at "
+                             "/raw/<host>/<path> (may be repeated)")
+    parser.add_argument("--github-token", default=getenv("GITHUB_TOKEN"),
+                        help="GitHub token (default $GITHUB_TOKEN)")
+    args = parser.parse_args(args)
+    http = HttpClient(auth_token=args.github_token,
+                      auth_hosts=(urlsplit(args.github_url).hostname,))
+    mirror = ReleaseMirror(args.host, args.port, args.github_url,
+                           args.pypi_url, args.ttl,
+                           args.raw_host or ("raw.githubusercontent.com",
+                                             "github.com"), http,
+                           args.github_ref or ("NeonGeckoCom/NeonCore",),
+                           args.max_entries)
+    http.metrics = mirror.metrics
+    try:
+        mirror.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mirror.shutdown()
+
+
+if __name__ == "__main__":
+    main()
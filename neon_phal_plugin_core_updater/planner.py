@@ -0,0 +1,105 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import re
+
+from typing import Iterable, Optional
+
+from neon_phal_plugin_core_updater.versions import get_release_base, \
+    parse_version
+
+# Update stages run by each plan, from cheapest to most expensive
+PLAN_STAGES = {
+    "config": ("update_config", "write_versions"),
+    "patch": ("fetch_patch", "run_patch", "write_versions"),
+    "package": ("update_config", "write_versions", "launch_update"),
+    "full": ("fetch_patch", "run_patch", "update_config", "write_versions",
+             "launch_update"),
+}
+
+# Default estimated seconds for each plan, used until a plan has been measured
+DEFAULT_ESTIMATES = {"config": 30, "patch": 120, "package": 300, "full": 1800}
+
+
+def normalize_requirements(requires: Optional[Iterable[str]]) -> \
+        Optional[frozenset]:
+    """
+    Normalize package requirements for comparison
+    @param requires: requirement strings from package metadata
+    @return: set of normalized requirements, or None if `requires` is unknown
+    """
+    if requires is None:
+        return None
+    normalized = set()
+    for requirement in requires:
+        requirement = re.sub(r"\s+", "", requirement).lower()
+        match = re.match(r"^([a-z0-9._-]+)(.*)$", requirement)
+        if match:
+            requirement = re.sub(r"[-_.]+", "-", match.group(1)) + \
+                match.group(2)
+        normalized.add(requirement.replace("'", '"'))
+    return frozenset(normalized)
+
+
+def plan_update(installed: str, target: str,
+                installed_requires: Optional[Iterable[str]] = None,
+                target_requires: Optional[Iterable[str]] = None,
+                patch: bool = False, package_update: bool = False) -> str:
+    """
+    Select the cheapest update plan that moves `installed` to `target`.
+    - `config`: versions match; only configuration is updated
+    - `patch`: versions match and a patch script is configured; the patch is
+      re-applied
+    - `package`: versions share a release (i.e. `22.10.1a1` -> `22.10.1a3`)
+      with identical requirements; only the core package is upgraded, without
+      running the patch for the (already patched) release
+    - `full`: any other update, including downgrades and updates where either
+      requirement set is unknown
+    @param installed: installed core version
+    @param target: version to update to ("" for the default branch)
+    @param installed_requires: requirements of the installed package
+    @param target_requires: requirements of the target version
+    @param patch: True if a patch script is configured
+    @param package_update: True if a single-package update command is
+        configured
+    @return: name of the selected plan (a key of `PLAN_STAGES`)
+    """
+    installed_version = parse_version(installed)
+    target_version = parse_version(target)
+    if not installed_version or not target_version:
+        return "full"
+    if target_version == installed_version:
+        return "patch" if patch else "config"
+    if target_version < installed_version or not package_update or \
+            get_release_base(target) != get_release_base(installed):
+        return "full"
+    installed_requires = normalize_requirements(installed_requires)
+    if installed_requires is None or \
+            installed_requires != normalize_requirements(target_requires):
+        return "full"
+    return "package"
@@ -0,0 +1,159 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+
+from os import listdir, makedirs, rename
+from os.path import isdir, join
+from shutil import rmtree, which
+from threading import Lock
+from typing import List, Optional
+from ovos_utils.log import LOG
+from ovos_utils.xdg_utils import xdg_cache_home
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.supervisor import ProcessSupervisor, \
+    with_priority
+from neon_phal_plugin_core_updater.versions import parse_version
+
+
+def get_default_prestage_dir() -> str:
+    """
+    Get the default directory to stage update artifacts in
+    """
+    return join(xdg_cache_home(), "neon", "core_updater", "wheels")
+
+
+class Prestager:
+    def __init__(self, directory: Optional[str] = None,
+                 spec: str = "{package}=={version}",
+                 python: Optional[str] = None,
+                 pip_args: Optional[List[str]] = None,
+                 bandwidth_limit: Optional[int] = None,
+                 nice: Optional[int] = 19, timeout: float = 1800,
+                 metrics: Optional[UpdaterMetrics] = None):
+        """
+        Downloads the packages needed to install a version ahead of time.
+        @param directory: directory to stage versions in
+        @param spec: requirement spec template formatted with `package` and
+            `version`, i.e. `{package}[extras]=={version}`
+        @param python: Python executable of the environment being updated
+        @param pip_args: extra arguments for `pip download`
+        @param bandwidth_limit: max download rate in KB/s (requires `trickle`)
+        @param nice: niceness to download with, None to not change priority
+        @param timeout: max seconds to allow for staging a version
+        @param metrics: UpdaterMetrics to record staging to
+        """
+        self.directory = directory or get_default_prestage_dir()
+        self.spec = spec
+        self.python = python or sys.executable
+        self.pip_args = pip_args or list()
+        self.bandwidth_limit = bandwidth_limit
+        self.nice = nice
+        self.timeout = timeout
+        self.metrics = metrics or UpdaterMetrics()
+        self.supervisor = ProcessSupervisor(metrics=self.metrics)
+        self._lock = Lock()
+
+    @staticmethod
+    def normalize_version(version: str) -> str:
+        """
+        Normalize a release name (i.e. a `v` prefixed tag) to a PEP 440 version
+        @param version: version or tag name
+        @return: normalized version, or `version` if it is not valid
+        """
+        parsed = parse_version(version)
+        return str(parsed) if parsed else version
+
+    def get_staged_dir(self, version: str) -> Optional[str]:
+        """
+        Get the directory containing staged packages for `version`
+        @param version: version to get staged packages for
+        @return: path to staged packages, or None if not staged
+        """
+        if not version:
+            return None
+        path = join(self.directory, self.normalize_version(version))
+        return path if isdir(path) else None
+
+    def get_command(self, package: str, version: str, dest: str) -> List[str]:
+        """
+        Get the command to download packages for `version` to `dest`
+        """
+        command = [self.python, "-m", "pip", "download", "--dest", dest,
+                   "--progress-bar", "off", *self.pip_args,
+                   self.spec.format(package=package, version=version)]
+        if self.bandwidth_limit:
+            if which("trickle"):
+                command = ["trickle", "-s", "-d", str(self.bandwidth_limit),
+                           *command]
+            else:
+                LOG.warning("`trickle` not found; bandwidth is not limited")
+        return with_priority(command, self.nice, idle_io=self.nice is not None)
+
+    def stage(self, package: str, version: str) -> Optional[str]:
+        """
+        Download packages needed to install `version` of `package`. Other
+        staged versions are removed once `version` is staged.
+        @param package: name of the package to stage
+        @param version: version to stage
+        @return: path to staged packages, or None if staging failed
+        """
+        version = self.normalize_version(version)
+        with self._lock:
+            staged = self.get_staged_dir(version)
+            if staged:
+                LOG.debug(f"Already staged: {staged}")
+                return staged
+            partial = join(self.directory, f".{version}.partial")
+            rmtree(partial, ignore_errors=True)
+            makedirs(partial)
+            command = self.get_command(package, version, partial)
+            LOG.info(f"Staging {package}=={version}: {command}")
+            try:
+                with self.metrics.timer("prestage"):
+                    code = self.supervisor.run(command, "prestage",
+                                               timeout=self.timeout)
+            except Exception as e:
+                LOG.error(f"Failed to stage {version}: {e}")
+                code = None
+            if code != 0:
+                if code is not None:
+                    LOG.error(f"Failed to stage {version}; pip exited with "
+                              f"code {code}")
+                self.metrics.increment("prestage_failures")
+                rmtree(partial, ignore_errors=True)
+                return None
+            staged = join(self.directory, version)
+            rename(partial, staged)
+            self.metrics.increment("prestage_completed")
+            LOG.info(f"Staged {version} in {staged}")
+            for name in listdir(self.directory):
+                if name != version and not name.startswith('.'):
+                    rmtree(join(self.directory, name), ignore_errors=True)
+            return staged
@@ -0,0 +1,209 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from os.path import isfile, join
+from threading import Lock, Thread
+from time import time
+from typing import Optional
+from ovos_utils.log import LOG
+from ovos_utils.xdg_utils import xdg_cache_home
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.util import atomic_write
+
+
+def get_default_cache_path() -> str:
+    """
+    Get the default path to the persistent release cache
+    """
+    return join(xdg_cache_home(), "neon", "core_updater", "releases.json")
+
+
+class ReleaseCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = 900,
+                 stale_ttl: float = 3600, session=None,
+                 metrics: Optional[UpdaterMetrics] = None):
+        """
+        Persistent cache of remote JSON responses, keyed by URL.
+        @param path: path to the cache file, None for an in-memory cache
+        @param ttl: seconds a cached response is served without revalidation
+        @param stale_ttl: seconds after `ttl` expires that a stale response
+            is served while it is revalidated in the background
+        @param session: object with a `get` method used for requests
+            (default `requests`)
+        @param metrics: UpdaterMetrics to record cache usage to
+        """
+        self.path = path
+        self.session = session
+        self.metrics = metrics or UpdaterMetrics()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._loaded_entries = None
+        self._lock = Lock()
+        self._revalidating = set()
+
+    @property
+    def _entries(self) -> dict:
+        """
+        Cached entries, loaded from disk on first use
+        """
+        if self._loaded_entries is None:
+            self._load()
+        return self._loaded_entries
+
+    @_entries.setter
+    def _entries(self, entries: dict):
+        self._loaded_entries = entries
+
+    def _load(self):
+        """
+        Load cached entries from disk
+        """
+        self._entries = dict()
+        if not self.path or not isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except Exception as e:
+            LOG.warning(f"Ignoring invalid release cache {self.path}: {e}")
+            self._entries = dict()
+
+    def _save(self):
+        """
+        Atomically write cached entries to disk
+        """
+        if not self.path:
+            return
+        try:
+            atomic_write(self.path, json.dumps(self._entries))
+        except Exception as e:
+            LOG.error(f"Failed to write release cache {self.path}: {e}")
+
+    def clear(self):
+        """
+        Remove all cached entries
+        """
+        with self._lock:
+            self._entries = dict()
+            self._save()
+
+    def get_json(self, url: str, headers: Optional[dict] = None):
+        """
+        Get the parsed JSON body of `url`, using cached data where possible.
+        Expired entries are revalidated with a conditional request and stale
+        data is returned if the remote is unavailable or rate-limited.
+        @param url: URL to GET
+        @param headers: optional headers to include in requests
+        @return: parsed JSON response
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry:
+            age = time() - entry.get("fetched", 0)
+            if age < self.ttl:
+                LOG.debug(f"Cache hit: {url}")
+                self.metrics.increment("cache_hits")
+                return entry["data"]
+            if age < self.ttl + self.stale_ttl:
+                LOG.debug(f"Serving stale cache entry for: {url}")
+                self.metrics.increment("cache_stale_hits")
+                self._revalidate_async(url, headers)
+                return entry["data"]
+        self.metrics.increment("cache_misses")
+        return self._fetch(url, entry, headers)
+
+    def _revalidate_async(self, url: str, headers: Optional[dict] = None):
+        """
+        Revalidate a cache entry in a background thread
+        """
+        with self._lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+
+        def _revalidate():
+            try:
+                with self._lock:
+                    entry = self._entries.get(url)
+                self._fetch(url, entry, headers)
+            except Exception as e:
+                LOG.warning(f"Failed to revalidate {url}: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(url)
+
+        Thread(target=_revalidate, daemon=True).start()
+
+    def _fetch(self, url: str, entry: Optional[dict],
+               headers: Optional[dict] = None):
+        """
+        Request `url`, sending validators from `entry` if available
+        @param url: URL to GET
+        @param entry: cached entry for `url`, if any
+        @param headers: optional headers to include in the request
+        @return: parsed JSON response
+        """
+        import requests
+        headers = dict(headers or {})
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            resp = (self.session or requests).get(url, headers=headers)
+        except requests.RequestException as e:
+            if entry:
+                LOG.warning(f"Request failed, using cached data: {e}")
+                self.metrics.increment("cache_fallbacks")
+                return entry["data"]
+            raise e
+        if resp.status_code == 304 and entry:
+            LOG.debug(f"Not modified: {url}")
+            self.metrics.increment("cache_revalidated")
+            entry["fetched"] = time()
+        elif resp.ok:
+            with self.metrics.timer("json_parse"):
+                data = resp.json()
+            entry = {"etag": resp.headers.get("ETag"),
+                     "last_modified": resp.headers.get("Last-Modified"),
+                     "fetched": time(),
+                     "data": data}
+        elif entry:
+            LOG.warning(f"Got {resp.status_code} from {url}, "
+                        f"using cached data")
+            self.metrics.increment("cache_fallbacks")
+            return entry["data"]
+        else:
+            resp.raise_for_status()
+        with self._lock:
+            self._entries[url] = entry
+            self._save()
+        return entry["data"]
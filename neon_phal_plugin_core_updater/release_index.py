@@ -0,0 +1,190 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from os.path import isfile, join
+from threading import Lock
+from time import time
+from typing import List, Optional
+from ovos_utils.log import LOG
+from ovos_utils.xdg_utils import xdg_cache_home
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.util import atomic_write
+
+RELEASE_FIELDS = ("id", "tag_name", "created_at", "prerelease")
+
+
+def get_default_index_path(github_ref: str) -> str:
+    """
+    Get the default path to the persisted release index for `github_ref`
+    """
+    return join(xdg_cache_home(), "neon", "core_updater",
+                f"{github_ref.replace('/', '_')}_releases.json")
+
+
+class GitHubReleaseIndex:
+    def __init__(self, github_ref: str, path: Optional[str] = None,
+                 session=None, api_url: str = "https://api.github.com",
+                 per_page: int = 100, ttl: float = 900,
+                 metrics: Optional[UpdaterMetrics] = None):
+        """
+        Persistent, incrementally updated index of a repository's releases.
+        @param github_ref: GitHub repository (`owner/repo`)
+        @param path: path to the index file, None for an in-memory index
+        @param session: object with a `get` method used for requests
+            (default `requests`)
+        @param api_url: base URL of the GitHub API
+        @param per_page: number of releases to request per page
+        @param ttl: seconds after a refresh that the index is used without
+            checking for new releases
+        @param metrics: UpdaterMetrics to record index usage to
+        """
+        self.github_ref = github_ref
+        self.path = path
+        self.session = session
+        self.api_url = api_url.rstrip('/')
+        self.per_page = per_page
+        self.ttl = ttl
+        self.metrics = metrics or UpdaterMetrics()
+        self._lock = Lock()
+        self._index = {"releases": [], "etag": None, "refreshed": 0}
+        self._load()
+
+    @property
+    def releases(self) -> List[dict]:
+        """
+        Indexed releases in reverse-chronological order (newest first)
+        """
+        return self._index["releases"]
+
+    def _load(self):
+        """
+        Load the persisted index from disk
+        """
+        if not self.path or not isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+            if index.get("github_ref") == self.github_ref:
+                self._index = index
+        except Exception as e:
+            LOG.warning(f"Ignoring invalid release index {self.path}: {e}")
+
+    def _save(self):
+        """
+        Atomically write the index to disk
+        """
+        if not self.path:
+            return
+        try:
+            atomic_write(self.path, json.dumps(
+                {**self._index, "github_ref": self.github_ref}))
+        except Exception as e:
+            LOG.error(f"Failed to write release index {self.path}: {e}")
+
+    def get_releases(self) -> List[dict]:
+        """
+        Get releases, refreshing the index if it has expired. If the refresh
+        fails, the existing index is returned.
+        @return: list of releases in reverse-chronological order
+        """
+        with self._lock:
+            if time() - self._index.get("refreshed", 0) < self.ttl:
+                self.metrics.increment("index_hits")
+            else:
+                self.metrics.increment("index_misses")
+                try:
+                    self._refresh()
+                except Exception as e:
+                    if not self.releases:
+                        raise e
+                    LOG.warning(f"Failed to refresh release index, using "
+                                f"existing index: {e}")
+            return self.releases
+
+    def _refresh(self):
+        """
+        Fetch releases newer than the newest indexed release, following
+        pagination only until a known release is found. Indexed releases in
+        the range of the first page are replaced by that page, so releases
+        deleted or edited upstream are removed or updated.
+        """
+        import requests
+        session = self.session or requests
+        known = set(r["id"] for r in self.releases)
+        url = f"{self.api_url}/repos/{self.github_ref}/releases?" \
+              f"per_page={self.per_page}"
+        headers = {"If-None-Match": self._index["etag"]} \
+            if self._index.get("etag") and known else {}
+        releases = list(self.releases)
+        first_page = True
+        etag = None
+        while url:
+            resp = session.get(url, headers=headers)
+            if resp.status_code == 304:
+                LOG.debug(f"No new releases for {self.github_ref}")
+                self.metrics.increment("index_revalidated")
+                break
+            resp.raise_for_status()
+            etag = etag or resp.headers.get("ETag")
+            with self.metrics.timer("json_parse"):
+                page = [{k: r.get(k) for k in RELEASE_FIELDS}
+                        for r in resp.json()]
+            url = resp.links.get("next", {}).get("url")
+            new = [r for r in page if r["id"] not in known]
+            if first_page:
+                # Pages are newest first; the first page is authoritative for
+                # releases created since its oldest release (or all releases
+                # if there are no more pages)
+                oldest = min((r.get("created_at") or "" for r in page),
+                             default="")
+                page_ids = set(r["id"] for r in page)
+                releases = page + [
+                    r for r in releases if r["id"] not in page_ids and
+                    url and (r.get("created_at") or "") < oldest]
+                first_page = False
+            else:
+                releases.extend(new)
+            if len(new) < len(page):
+                # Reached a release that is already indexed
+                break
+            headers = {}
+        # ISO 8601 UTC timestamps sort chronologically as strings
+        releases.sort(key=lambda r: r.get("created_at") or "", reverse=True)
+        if releases != self.releases:
+            added = len(set(r["id"] for r in releases) - known)
+            LOG.info(f"Indexed {added} new releases for {self.github_ref} "
+                     f"({len(releases)} total)")
+            self._index["releases"] = releases
+        if etag:
+            self._index["etag"] = etag
+        self._index["refreshed"] = time()
+        self._save()
@@ -0,0 +1,99 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from random import uniform
+from threading import Event, Thread
+from typing import Callable, Optional
+from ovos_utils.log import LOG
+
+
+class UpdateScheduler:
+    def __init__(self, check: Callable[[], None], interval: float,
+                 jitter: Optional[float] = None, retry_delay: float = 60,
+                 initial_delay: float = 0):
+        """
+        Periodically calls `check` in a background thread.
+        @param check: callable to run; an exception is treated as a failure
+        @param interval: seconds between successful checks
+        @param jitter: max random seconds added to or removed from each
+            delay (default 10% of `interval`)
+        @param retry_delay: seconds before the first retry after a failure;
+            doubled after each consecutive failure, up to `interval`
+        @param initial_delay: seconds to wait before the first check
+        """
+        self._check = check
+        self.interval = interval
+        self.jitter = interval * 0.1 if jitter is None else jitter
+        self.retry_delay = retry_delay
+        self.initial_delay = initial_delay
+        self.failures = 0
+        self._stopping = Event()
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="core_updater_scheduler")
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self):
+        """
+        Start periodic checks
+        """
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """
+        Stop periodic checks and wait for the scheduler thread to exit
+        @param timeout: max seconds to wait for an in-progress check
+        """
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def get_delay(self) -> float:
+        """
+        Get the number of seconds until the next check
+        """
+        if self.failures:
+            delay = min(self.retry_delay * 2 ** (self.failures - 1),
+                        self.interval)
+        else:
+            delay = self.interval
+        return max(delay + uniform(-self.jitter, self.jitter), 0)
+
+    def _run(self):
+        delay = self.initial_delay
+        while not self._stopping.wait(delay):
+            try:
+                self._check()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                LOG.warning(f"Scheduled update check failed "
+                            f"({self.failures}): {e}")
+            delay = self.get_delay()
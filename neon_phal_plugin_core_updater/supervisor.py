@@ -0,0 +1,230 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from os import killpg, makedirs
+from os.path import dirname, join
+from shutil import which
+from signal import SIGKILL, SIGTERM
+from subprocess import Popen, PIPE, STDOUT, DEVNULL, TimeoutExpired
+from threading import Lock, Thread
+from typing import Callable, List, Optional, Union
+from ovos_utils.log import LOG
+from ovos_utils.xdg_utils import xdg_state_home
+
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+
+
+def get_default_update_log_path() -> str:
+    """
+    Get the default path to write update command output to
+    """
+    return join(xdg_state_home(), "neon", "core_updater", "update.log")
+
+
+def with_priority(command: List[str], nice: Optional[int] = None,
+                  idle_io: bool = False) -> List[str]:
+    """
+    Wrap a command to run with a lower CPU and/or IO priority
+    @param command: command to run
+    @param nice: niceness to run with, None to not change CPU priority
+    @param idle_io: if True, run in the idle IO class (requires `ionice`)
+    @return: wrapped command
+    """
+    if idle_io:
+        if which("ionice"):
+            command = ["ionice", "-c", "3", *command]
+        else:
+            LOG.warning("`ionice` not found; IO priority is not changed")
+    if nice is not None:
+        command = ["nice", "-n", str(nice), *command]
+    return command
+
+
+class ProcessSupervisor:
+    def __init__(self, nice: Optional[int] = None, idle_io: bool = False,
+                 kill_timeout: float = 10, max_line_length: int = 1024,
+                 metrics: Optional[UpdaterMetrics] = None):
+        """
+        Runs update processes in their own process group, logging output line
+        by line and stopping processes that exceed their timeout or are
+        cancelled (SIGTERM, then SIGKILL after `kill_timeout`).
+        @param nice: niceness to run processes with, None to not change
+        @param idle_io: if True, run processes in the idle IO class
+        @param kill_timeout: seconds to wait after SIGTERM before SIGKILL
+        @param max_line_length: max bytes of output to log per line; longer
+            lines are logged in parts
+        @param metrics: UpdaterMetrics to record process results to
+        """
+        self.nice = nice
+        self.idle_io = idle_io
+        self.kill_timeout = kill_timeout
+        self.max_line_length = max_line_length
+        self.metrics = metrics or UpdaterMetrics()
+        self._lock = Lock()
+        self._processes = set()
+
+    @property
+    def running(self) -> bool:
+        """
+        True if any supervised process is running
+        """
+        with self._lock:
+            return bool(self._processes)
+
+    def get_command(self, command: Union[str, List[str]]) -> List[str]:
+        """
+        Get the command to run, with the configured priority applied
+        @param command: list of arguments, or a string to run in a shell
+        """
+        if isinstance(command, str):
+            command = ["/bin/sh", "-c", command]
+        return with_priority(command, self.nice, self.idle_io)
+
+    def start(self, command: Union[str, List[str]], name: str,
+              timeout: Optional[float] = None, env: Optional[dict] = None,
+              log_path: Optional[str] = None,
+              on_exit: Optional[Callable[[int], None]] = None) -> Popen:
+        """
+        Start a process and supervise it in the background
+        @param command: list of arguments, or a string to run in a shell
+        @param name: name to identify the process in logs and metrics
+        @param timeout: max seconds the process may run
+        @param env: environment to run the process with
+        @param log_path: file to append output to instead of logging it
+        @param on_exit: callback to call with the exit code when it exits
+        @return: started process
+        """
+        process = self._start(command, name, env, log_path)
+        Thread(target=self._supervise, args=(process, name, timeout, on_exit),
+               daemon=True, name=f"supervisor_{name}").start()
+        return process
+
+    def run(self, command: Union[str, List[str]], name: str,
+            timeout: Optional[float] = None,
+            env: Optional[dict] = None) -> int:
+        """
+        Run a process and wait for it to exit
+        @param command: list of arguments, or a string to run in a shell
+        @param name: name to identify the process in logs and metrics
+        @param timeout: max seconds the process may run
+        @param env: environment to run the process with
+        @return: exit code (negative if stopped by a signal)
+        @raises TimeoutExpired: if the process was stopped after `timeout`
+        """
+        process = self._start(command, name, env)
+        if self._supervise(process, name, timeout):
+            raise TimeoutExpired(process.args, timeout)
+        return process.returncode
+
+    def cancel(self) -> bool:
+        """
+        Stop all supervised processes
+        @return: True if any process was running
+        """
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            LOG.info(f"Cancelling process: {process.pid}")
+            self.terminate(process)
+        return bool(processes)
+
+    def terminate(self, process: Popen):
+        """
+        Stop a process and its process group, killing it if it does not exit
+        within `kill_timeout` seconds
+        @param process: process to stop
+        """
+        try:
+            killpg(process.pid, SIGTERM)
+            try:
+                process.wait(self.kill_timeout)
+            except TimeoutExpired:
+                LOG.warning(f"Killing process: {process.pid}")
+                killpg(process.pid, SIGKILL)
+                process.wait()
+        except ProcessLookupError:
+            pass
+
+    def _start(self, command: Union[str, List[str]], name: str,
+               env: Optional[dict] = None,
+               log_path: Optional[str] = None) -> Popen:
+        command = self.get_command(command)
+        LOG.debug(f"Starting {name}: {command}")
+        if log_path:
+            makedirs(dirname(log_path), exist_ok=True)
+            with open(log_path, 'ab') as log:
+                process = Popen(command, stdin=DEVNULL, stdout=log,
+                                stderr=STDOUT, env=env,
+                                start_new_session=True)
+        else:
+            process = Popen(command, stdin=DEVNULL, stdout=PIPE,
+                            stderr=STDOUT, env=env, start_new_session=True)
+            Thread(target=self._log_output, args=(process, name),
+                   daemon=True, name=f"supervisor_{name}_output").start()
+        with self._lock:
+            self._processes.add(process)
+        self.metrics.increment(f"process_{name}_started")
+        return process
+
+    def _supervise(self, process: Popen, name: str,
+                   timeout: Optional[float] = None,
+                   on_exit: Optional[Callable[[int], None]] = None) -> bool:
+        """
+        Wait for a process to exit, stopping it after `timeout`
+        @return: True if the process was stopped for exceeding `timeout`
+        """
+        timed_out = False
+        try:
+            with self.metrics.timer(f"process_{name}"):
+                try:
+                    process.wait(timeout)
+                except TimeoutExpired:
+                    LOG.error(f"{name} exceeded timeout of {timeout}s")
+                    self.metrics.increment(f"process_{name}_timeouts")
+                    timed_out = True
+                    self.terminate(process)
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        LOG.info(f"{name} exited with code: {process.returncode}")
+        if on_exit:
+            try:
+                on_exit(process.returncode)
+            except Exception as e:
+                LOG.error(f"Exit handler for {name} failed: {e}")
+        return timed_out
+
+    def _log_output(self, process: Popen, name: str):
+        """
+        Log process output line by line as it is written
+        """
+        with process.stdout as stream:
+            for line in iter(lambda: stream.readline(self.max_line_length),
+                             b""):
+                LOG.info(f"{name}: "
+                         f"{line.decode('utf-8', 'replace').rstrip()}")
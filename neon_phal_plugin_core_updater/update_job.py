@@ -0,0 +1,115 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from time import time
+from typing import Optional
+from uuid import uuid4
+from ovos_bus_client.message import Message
+
+from neon_phal_plugin_core_updater.versions import get_release_base, \
+    parse_version
+
+UPDATE_STAGES = ("fetch_patch", "run_patch", "update_config",
+                 "write_versions", "launch_update")
+
+
+class UpdateJob:
+    def __init__(self, version: str, message: Message,
+                 job_id: Optional[str] = None):
+        """
+        State of a single core update run.
+        @param version: requested core version ("" for the default branch)
+        @param message: `neon.core_updater.start_update` Message
+        @param job_id: unique ID of this job (generated if not specified)
+        """
+        self.job_id = job_id or str(uuid4())
+        self.version = version
+        self.message = message
+        parsed = parse_version(version)
+        prerelease = parsed.is_prerelease if parsed else "a" in version
+        self.default_branch = "dev" if prerelease else "master"
+        self.patch_ver = get_release_base(version) if version else "master"
+        self.patch_path = None
+        self.requested = time()
+        self.stages = dict()
+        self.status = "queued"
+        self.finished = None
+        self.plan = None
+        self.cancelled = False
+        self.resume_attempts = 0
+
+    @property
+    def branch_spec(self) -> str:
+        return self.version or "master"
+
+    def is_done(self, stage: str) -> bool:
+        """
+        Check if a stage already finished (completed, skipped, or failed)
+        @param stage: name of the stage to check
+        @return: True if `stage` does not need to run again
+        """
+        return self.stages.get(stage, {}).get("status") in ("completed",
+                                                            "skipped",
+                                                            "failed")
+
+    def to_dict(self) -> dict:
+        return {"job_id": self.job_id,
+                "version": self.version,
+                "patch_ver": self.patch_ver,
+                "default_branch": self.default_branch,
+                "patch_path": self.patch_path,
+                "requested": self.requested,
+                "finished": self.finished,
+                "status": self.status,
+                "plan": self.plan,
+                "resume_attempts": self.resume_attempts,
+                "stages": self.stages,
+                "context": self.message.context}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Restore a job serialized with `to_dict`
+        @param data: serialized UpdateJob
+        @return: UpdateJob object
+        """
+        job = cls(data["version"],
+                  Message("neon.core_updater.start_update",
+                          {"version": data["version"]},
+                          data.get("context") or {}),
+                  data["job_id"])
+        job.patch_ver = data.get("patch_ver", job.patch_ver)
+        job.default_branch = data.get("default_branch", job.default_branch)
+        job.patch_path = data.get("patch_path")
+        job.requested = data.get("requested", job.requested)
+        job.finished = data.get("finished")
+        job.status = data.get("status", job.status)
+        job.plan = data.get("plan")
+        job.resume_attempts = data.get("resume_attempts", 0)
+        job.stages = data.get("stages") or dict()
+        return job
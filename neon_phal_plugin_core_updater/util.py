@@ -0,0 +1,62 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from os import chmod, fsync, makedirs, remove, replace
+from os.path import dirname
+from tempfile import mkstemp
+from typing import Optional
+
+
+def atomic_write(path: str, content: str, mode: Optional[int] = None,
+                 sync: bool = False):
+    """
+    Write `content` to a temporary file and move it over `path`, so readers
+    never see a partial file. The temporary file is removed if writing fails.
+    @param path: path to write to
+    @param content: string content to write
+    @param mode: optional file mode to set before moving the file into place
+    @param sync: if True, flush the file to disk before moving it into place
+    """
+    directory = dirname(path) or "."
+    makedirs(directory, exist_ok=True)
+    ref, temp_path = mkstemp(dir=directory)
+    try:
+        with open(ref, 'w') as f:
+            f.write(content)
+            if sync:
+                f.flush()
+                fsync(f.fileno())
+        if mode is not None:
+            chmod(temp_path, mode)
+        replace(temp_path, path)
+    except BaseException:
+        try:
+            remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
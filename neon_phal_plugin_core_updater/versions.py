@@ -0,0 +1,139 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import re
+
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+from ovos_utils.log import LOG
+
+CHANNELS = ("stable", "beta", "alpha")
+
+
+@lru_cache(maxsize=1024)
+def parse_version(version: str):
+    """
+    Parse a release name into a comparable PEP 440 version
+    @param version: version or tag name, optionally prefixed with `v`
+    @return: parsed `packaging.version.Version`, or None if `version` is not
+        a valid version
+    """
+    from packaging.version import InvalidVersion, Version
+    if not version:
+        return None
+    try:
+        return Version(version.strip().lstrip("vV"))
+    except InvalidVersion:
+        return None
+
+
+@lru_cache(maxsize=64)
+def parse_pin(pin: str):
+    """
+    Parse a version pin into a specifier. A pin may be a PEP 440 specifier
+    (`~=23.1`, `>=23.0,<24.0`) or a version prefix (`23.x`, `23.04.*`).
+    @param pin: version pin to parse
+    @return: parsed `packaging.specifiers.SpecifierSet`, or None if `pin` is
+        empty or invalid
+    """
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+    if not pin:
+        return None
+    pin = pin.strip()
+    if re.match(r"^v?\d+(\.\d+)*\.[x*]$", pin):
+        pin = f"=={pin.lstrip('vV')[:-1]}*"
+    try:
+        return SpecifierSet(pin)
+    except InvalidSpecifier:
+        LOG.error(f"Ignoring invalid version pin: {pin}")
+        return None
+
+
+def is_allowed(version, channel: str = "stable",
+               pin: Optional[str] = None) -> bool:
+    """
+    Check if a version may be installed from the specified channel
+    @param version: parsed Version to check
+    @param channel: `stable`, `beta` (includes beta and release candidates),
+        or `alpha` (includes all pre-releases)
+    @param pin: optional version pin the version must satisfy
+    @return: True if `version` is allowed
+    """
+    if version.is_prerelease:
+        if channel == "stable":
+            return False
+        if channel == "beta" and (version.is_devrelease or
+                                  version.pre[0] == "a"):
+            return False
+    specifier = parse_pin(pin)
+    if specifier and not specifier.contains(version, prereleases=True):
+        return False
+    return True
+
+
+def select_update(releases: Iterable[str], installed: str,
+                  channel: str = "stable",
+                  pin: Optional[str] = None) -> Tuple[Optional[str],
+                                                      Optional[str]]:
+    """
+    Select the latest release and the release to update to, if any.
+    If the installed version is a pre-release not allowed by `channel`, the
+    latest allowed release is an update even if it is an older version.
+    @param releases: release names to consider
+    @param installed: currently installed version
+    @param channel: release channel (see `is_allowed`)
+    @param pin: optional version pin releases must satisfy
+    @return: new version (or None if up to date), latest allowed version
+    """
+    candidates = ((parse_version(r), r) for r in releases if r)
+    latest = max(((v, r) for v, r in candidates
+                  if v and is_allowed(v, channel, pin)),
+                 key=lambda c: c[0], default=None)
+    if not latest:
+        return None, None
+    latest_version, latest_name = latest
+    installed_version = parse_version(installed)
+    if not installed_version:
+        return (latest_name if latest_name != installed else None,
+                latest_name)
+    if latest_version > installed_version or \
+            (latest_version != installed_version and
+             not is_allowed(installed_version, channel)):
+        return latest_name, latest_name
+    return None, latest_name
+
+
+def get_release_base(version: str) -> str:
+    """
+    Get the release segment of a version as written, without a `v` prefix
+    or pre-, post-, or dev-release suffixes (i.e. `22.10.1a1` -> `22.10.1`)
+    @param version: version string
+    @return: release segment of `version`
+    """
+    match = re.match(r"^v?(\d+(\.\d+)*)", version.strip(), re.IGNORECASE)
+    return match.group(1) if match else version
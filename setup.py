@@ -30,6 +30,7 @@ from setuptools import setup, find_packages
 from os import path, getenv
 
 PLUGIN_ENTRY_POINT = "neon-phal-plugin-core-updater=neon_phal_plugin_core_updater:CoreUpdater"
+MIRROR_ENTRY_POINT = "neon-core-updater-mirror=neon_phal_plugin_core_updater.mirror:main"
 BASE_PATH = path.abspath(path.dirname(__file__))
 
 
@@ -67,5 +68,6 @@ setup(
     long_description_content_type="text/markdown",
     install_requires=get_requirements('requirements.txt'),
     packages=find_packages(),
-    entry_points={'ovos.plugin.phal.admin': PLUGIN_ENTRY_POINT}
+    entry_points={'ovos.plugin.phal.admin': PLUGIN_ENTRY_POINT,
+                  'console_scripts': [MIRROR_ENTRY_POINT]}
 )
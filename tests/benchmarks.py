@@ -0,0 +1,339 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import subprocess
+import sys
+import unittest
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv
+from os.path import join
+from random import random
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from typing import Tuple
+from urllib.parse import parse_qs, urlparse
+from ovos_bus_client.message import Message
+from ovos_utils.messagebus import FakeBus
+
+# Load test parameters may be overridden with environment variables; results
+# are printed (i.e. `pytest -s tests/benchmarks.py`)
+LATENCY = float(getenv("BENCH_LATENCY", 0.05))
+RELEASE_COUNT = int(getenv("BENCH_RELEASES", 300))
+ERROR_RATE = float(getenv("BENCH_ERROR_RATE", 0.0))
+BURST_SIZE = int(getenv("BENCH_REQUESTS", 200))
+CONCURRENCY = int(getenv("BENCH_CONCURRENCY", 16))
+
+IMPORT_SCRIPT = """
+from time import perf_counter
+import ovos_plugin_manager.phal
+import ovos_bus_client.message
+start = perf_counter()
+import neon_phal_plugin_core_updater
+print(perf_counter() - start)
+"""
+
+
+class StubReleaseServer:
+    """
+    Local server mimicking the GitHub releases API and PyPI JSON API
+    """
+    def __init__(self, release_count: int = RELEASE_COUNT,
+                 latency: float = LATENCY, error_rate: float = ERROR_RATE):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._lock = Lock()
+        self.releases = list()
+        for i in range(release_count):
+            version = f"{20 + i // 120}.{(i // 10) % 12 + 1}.{i % 10}"
+            self.releases.append({
+                "id": i, "tag_name": version if i % 3 else f"{version}a1",
+                "prerelease": not i % 3,
+                "created_at": f"{2020 + i // 120}-{(i // 10) % 12 + 1:02d}-"
+                              f"{i % 10 + 1:02d}T00:00:00Z",
+                "body": "Release notes " * 50, "assets": []})
+        self.releases.reverse()
+        self.patch_script = b"#!/bin/sh\nexit 0\n"
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        url = urlparse(handler.path)
+        query = parse_qs(url.query)
+        route = url.path.rstrip('/').split('/')[-1]
+        with self._lock:
+            self.calls[route] += 1
+        sleep(self.latency)
+        if random() < self.error_rate:
+            return self._send(handler, 503, b"{}")
+        stable = [r for r in self.releases if not r["prerelease"]]
+        etag = f'"{len(self.releases)}"'
+        if handler.headers.get("If-None-Match") == etag:
+            return self._send(handler, 304, b"", {"ETag": etag})
+        if url.path.endswith("/releases/latest"):
+            return self._send(handler, 200, json.dumps(stable[0]).encode(),
+                              {"ETag": etag})
+        if url.path.endswith("/releases"):
+            per_page = int(query.get("per_page", [30])[0])
+            page = int(query.get("page", [1])[0])
+            body = self.releases[(page - 1) * per_page:page * per_page]
+            headers = {"ETag": etag}
+            if page * per_page < len(self.releases):
+                headers["Link"] = f'<{self.url}{url.path}?per_page=' \
+                                  f'{per_page}&page={page + 1}>; rel="next"'
+            return self._send(handler, 200, json.dumps(body).encode(),
+                              headers)
+        if url.path.endswith("/json"):
+            body = {"releases": {
+                r["tag_name"]: [{"upload_time_iso_8601": r["created_at"]}]
+                for r in self.releases}}
+            return self._send(handler, 200, json.dumps(body).encode(),
+                              {"ETag": etag})
+        if url.path.endswith("patch.sh"):
+            return self._send(handler, 200, self.patch_script)
+        self._send(handler, 404, b"{}")
+
+    @staticmethod
+    def _send(handler, status: int, body: bytes, headers: dict = None):
+        handler.send_response(status)
+        for key, val in (headers or {}).items():
+            handler.send_header(key, val)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def _run_burst(bus: FakeBus, messages: list,
+               concurrency: int = CONCURRENCY) -> Tuple[list, float]:
+    """
+    Send `messages` concurrently and wait for each response
+    @return: list of (latency, response), total seconds elapsed
+    """
+    def _send(msg):
+        start = perf_counter()
+        resp = bus.wait_for_response(msg, timeout=30)
+        return perf_counter() - start, resp
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(_send, messages))
+    return results, perf_counter() - start
+
+
+def _report_burst(name: str, results: list, elapsed: float,
+                  server: StubReleaseServer, calls_before: int):
+    times = sorted(r[0] for r in results)
+    print(f"{name}: n={len(times)} "
+          f"throughput={len(times) / elapsed:.1f}/s "
+          f"p50={times[len(times) // 2] * 1000:.2f}ms "
+          f"p99={times[int(len(times) * 0.99) - 1] * 1000:.2f}ms "
+          f"http_calls={server.total_calls - calls_before}")
+
+
+def _report(name: str, times: list):
+    times = sorted(times)
+    print(f"{name}: min={times[0] * 1000:.2f}ms "
+          f"p50={times[len(times) // 2] * 1000:.2f}ms "
+          f"max={times[-1] * 1000:.2f}ms (n={len(times)})")
+
+
+class StartupBenchmarks(unittest.TestCase):
+    def test_import_time(self):
+        """
+        Time importing the plugin module, excluding the PHAL base class
+        dependencies shared with other plugins.
+        """
+        times = list()
+        for _ in range(5):
+            out = subprocess.check_output([sys.executable, "-c",
+                                           IMPORT_SCRIPT], text=True,
+                                          stderr=subprocess.DEVNULL)
+            times.append(float(out.splitlines()[-1]))
+        _report("import", times)
+        self.assertLess(min(times), 0.5)
+
+    def test_import_does_not_resolve_version(self):
+        script = "import sys, neon_phal_plugin_core_updater\n" \
+                 "print('neon_utils.packaging_utils' in sys.modules)"
+        out = subprocess.check_output([sys.executable, "-c", script],
+                                      text=True, stderr=subprocess.DEVNULL)
+        self.assertEqual(out.splitlines()[-1], "False")
+
+    def test_construction_time(self):
+        """
+        Time constructing the plugin. No remote lookups or package metadata
+        resolution may block construction.
+        """
+        from unittest.mock import patch
+        from neon_phal_plugin_core_updater import CoreUpdater
+        config = {"release_cache_path": join(mkdtemp(), "cache.json"),
+                  "update_journal_path": join(mkdtemp(), "update_job.json")}
+        times = list()
+        with patch.object(CoreUpdater, "_get_installed_core_version"):
+            for _ in range(20):
+                bus = FakeBus()
+                start = perf_counter()
+                plugin = CoreUpdater(bus, config=config)
+                times.append(perf_counter() - start)
+                plugin.shutdown()
+        _report("construct", times)
+        self.assertLess(sorted(times)[len(times) // 2], 0.1)
+
+
+class LoadBenchmarks(unittest.TestCase):
+    server = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubReleaseServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def _get_plugin(self, **config):
+        from neon_phal_plugin_core_updater import CoreUpdater
+        bus = FakeBus()
+        cache_dir = mkdtemp()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(cache_dir, "cache.json"),
+            "release_index_path": join(cache_dir, "index.json"),
+            "update_journal_path": join(cache_dir, "update_job.json"),
+            "github_api_url": self.server.url,
+            "pypi_index_url": self.server.url,
+            "http_backoff": 0.01, **config})
+        plugin._installed_version = self.server.releases[-1]["tag_name"]
+        return bus, plugin
+
+    def test_check_update_github(self):
+        for ttl in (0, 900):
+            bus, plugin = self._get_plugin(release_cache_ttl=ttl,
+                                           release_cache_stale_ttl=0)
+            messages = [Message("neon.core_updater.check_update",
+                                {"include_prerelease": bool(i % 2)})
+                        for i in range(BURST_SIZE)]
+            calls = self.server.total_calls
+            results, elapsed = _run_burst(bus, messages)
+            _report_burst(f"check_update github ttl={ttl}", results, elapsed,
+                          self.server, calls)
+            plugin.shutdown()
+            if ERROR_RATE:
+                continue
+            self.assertTrue(all(r[1] for r in results))
+            if ttl:
+                # Paginated index plus `latest`, each fetched once
+                self.assertLessEqual(self.server.total_calls - calls,
+                                     RELEASE_COUNT // 100 + 2)
+
+    def test_check_update_pypi(self):
+        bus, plugin = self._get_plugin(pypi_ref="neon-core")
+        messages = [Message("neon.core_updater.check_update",
+                            {"include_prerelease": bool(i % 2)})
+                    for i in range(BURST_SIZE)]
+        calls = self.server.total_calls
+        results, elapsed = _run_burst(bus, messages)
+        _report_burst("check_update pypi", results, elapsed, self.server,
+                      calls)
+        plugin.shutdown()
+        if ERROR_RATE:
+            return
+        self.assertTrue(all(r[1] for r in results))
+        # At most one fetch per concurrently checked channel
+        self.assertLessEqual(self.server.total_calls - calls, 2)
+
+    def test_get_version(self):
+        bus, plugin = self._get_plugin()
+        messages = [Message("neon.core_updater.get_version")
+                    for _ in range(BURST_SIZE)]
+        calls = self.server.total_calls
+        results, elapsed = _run_burst(bus, messages)
+        _report_burst("get_version", results, elapsed, self.server, calls)
+        plugin.shutdown()
+        self.assertTrue(all(r[1] for r in results))
+
+    def test_start_update(self):
+        """
+        Time `start_update` responses under a burst of requests. Only one
+        update runs at a time; concurrent requests are rejected.
+        """
+        bus, plugin = self._get_plugin(
+            patch_script=f"{self.server.url}/{{}}/patch.sh")
+        count = max(BURST_SIZE // 10, 1)
+        completed = list()
+
+        def _on_progress(msg):
+            if msg.data["stage"] is None:
+                completed.append(msg)
+
+        bus.on("neon.core_updater.progress", _on_progress)
+        bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+        messages = [Message("neon.core_updater.start_update",
+                            {"version": self.server.releases[0]["tag_name"]})
+                    for _ in range(count)]
+        calls = self.server.total_calls
+        start = perf_counter()
+        results, elapsed = _run_burst(bus, messages)
+        _report_burst("start_update response", results, elapsed,
+                      self.server, calls)
+        end = perf_counter() + 60
+        while (plugin._active_job or not completed) and perf_counter() < end:
+            sleep(0.01)
+        job_time = perf_counter() - start
+        print(f"start_update jobs: n={len(completed)} "
+              f"throughput={len(completed) / job_time:.1f}/s")
+        plugin.shutdown()
+        self.assertTrue(all(r[1] for r in results))
+        self.assertIsNone(plugin._active_job)
+        self.assertTrue(completed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,22 +26,141 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import hashlib
+import json
+import os
+import requests
 import unittest
 
-from unittest.mock import Mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import isfile, join
+from tempfile import mkdtemp
+from threading import Event, Thread
+from subprocess import TimeoutExpired
+from time import sleep, time
+from unittest.mock import Mock, patch
+try:
+    from importlib.metadata import version
+except ImportError:
+    from importlib_metadata import version
 from ovos_bus_client.message import Message
 from neon_phal_plugin_core_updater import CoreUpdater
+from neon_phal_plugin_core_updater.download import download_file, \
+    get_remote_digest
+from neon_phal_plugin_core_updater.http_client import HttpClient
+from neon_phal_plugin_core_updater.journal import UpdateJournal
+from neon_phal_plugin_core_updater.metrics import UpdaterMetrics
+from neon_phal_plugin_core_updater.mirror import ReleaseMirror
+from neon_phal_plugin_core_updater.planner import normalize_requirements, \
+    plan_update
+from neon_phal_plugin_core_updater.prestage import Prestager
+from neon_phal_plugin_core_updater.release_cache import ReleaseCache
+from neon_phal_plugin_core_updater.scheduler import UpdateScheduler
+from neon_phal_plugin_core_updater.release_index import GitHubReleaseIndex
+from neon_phal_plugin_core_updater.single_flight import SingleFlight
+from neon_phal_plugin_core_updater.supervisor import ProcessSupervisor, \
+    with_priority
+from neon_phal_plugin_core_updater.util import atomic_write
+from neon_phal_plugin_core_updater.update_job import UpdateJob, \
+    UPDATE_STAGES
+from neon_phal_plugin_core_updater.versions import get_release_base, \
+    is_allowed, parse_pin, parse_version, select_update
 from ovos_utils.messagebus import FakeBus
 
 
+class StubServer:
+    """
+    Local HTTP server returning configurable responses by path
+    """
+    def __init__(self):
+        self.routes = dict()
+        self.requests = list()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                status, headers, body = stub.routes.get(
+                    self.path, (404, {}, b"{}"))
+                if callable(body):
+                    status, headers, body = body(self)
+                self.send_response(status)
+                for key, val in headers.items():
+                    self.send_header(key, val)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
 class PluginTests(unittest.TestCase):
     bus = FakeBus()
-    plugin = CoreUpdater(bus)
+    plugin = CoreUpdater(bus, config={
+        "release_cache_path": join(mkdtemp(), "cache.json"),
+        "update_journal_path": join(mkdtemp(), "update_job.json")})
 
     def test_get_installed_core_version(self):
         self.plugin.core_package = "non-existent-test-package"
         self.assertEqual(self.plugin._get_installed_core_version(), "0.0.0")
 
+    def test_installed_version(self):
+        plugin = CoreUpdater(FakeBus(), config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "core_module": "packaging"})
+        self.assertEqual(plugin._installed_version, version("packaging"))
+        _, path, mtime, _ = plugin._version_info
+        self.assertTrue(isfile(join(path, "METADATA")))
+
+        # Version is memoized
+        plugin._get_installed_core_version = Mock(return_value="1.0.0")
+        self.assertEqual(plugin._installed_version, version("packaging"))
+        plugin._get_installed_core_version.assert_not_called()
+
+        # Version is re-read when package metadata changes
+        plugin._version_info = ("0.0.1", path, mtime - 1, time())
+        self.assertEqual(plugin._installed_version, "1.0.0")
+        plugin._get_installed_core_version.assert_called_once()
+
+        # Missing package is checked again after an interval
+        plugin.core_package = "non-existent-test-package"
+        plugin._version_info = ("0.0.1", "/non-existent", 0, time())
+        plugin._get_installed_core_version = Mock(return_value="0.0.0")
+        self.assertEqual(plugin._installed_version, "0.0.0")
+        self.assertEqual(plugin._version_info[1:3], (None, None))
+        self.assertEqual(plugin._installed_version, "0.0.0")
+        plugin._get_installed_core_version.assert_called_once()
+        plugin.config["version_recheck_interval"] = 0
+        plugin._installed_version
+        self.assertEqual(plugin._get_installed_core_version.call_count, 2)
+        plugin.shutdown()
+
+    def test_shutdown(self):
+        bus = FakeBus()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "job.json"),
+            "core_module": "packaging"})
+        plugin.shutdown()
+        for event in ("get_version", "check_update", "start_update",
+                      "get_metrics", "get_update_status", "cancel_update"):
+            self.assertFalse(bus.ee.listeners(f"neon.core_updater.{event}"))
+        resp = bus.wait_for_response(Message(
+            "neon.core_updater.start_update", {"version": "1.0.0"}),
+            timeout=0.5)
+        self.assertIsNone(resp)
+        self.assertIsNone(plugin._active_job)
+
     def test_get_github_releases(self):
         self.assertEqual(self.plugin.github_ref, "NeonGeckoCom/NeonCore")
         releases = self.plugin._get_github_releases()
@@ -87,7 +206,7 @@ class PluginTests(unittest.TestCase):
         real_get_releases = self.plugin._get_github_releases
         real_get_latest = self.plugin._get_latest_github_release
         # In this example, 22.10.3 is a pre-release
-        gh_releases = ['22.10.3a1', '22.10.3', '22.10.1a1', '22.10.0',
+        gh_releases = ['22.10.4a1', '22.10.3', '22.10.1a1', '22.10.0',
                        '22.04.1a1', '22.04.0']
         self.plugin._get_github_releases = Mock(return_value=gh_releases)
         self.plugin._get_latest_github_release = Mock(return_value="22.10.0")
@@ -113,8 +232,8 @@ class PluginTests(unittest.TestCase):
             "neon.core_updater.check_update",
             {"include_prerelease": True}))
         self.assertIsInstance(resp, Message)
-        self.assertEqual(resp.data['new_version'], '22.10.3a1')
-        self.assertEqual(resp.data['latest_version'], '22.10.3a1')
+        self.assertEqual(resp.data['new_version'], '22.10.4a1')
+        self.assertEqual(resp.data['latest_version'], '22.10.4a1')
 
         # Update from alpha to newer stable
         self.plugin._installed_version = "22.04.1a1"
@@ -129,8 +248,8 @@ class PluginTests(unittest.TestCase):
             "neon.core_updater.check_update",
             {"include_prerelease": True}))
         self.assertIsInstance(resp, Message)
-        self.assertEqual(resp.data['new_version'], '22.10.3a1')
-        self.assertEqual(resp.data['latest_version'], '22.10.3a1')
+        self.assertEqual(resp.data['new_version'], '22.10.4a1')
+        self.assertEqual(resp.data['latest_version'], '22.10.4a1')
 
         # Update from alpha to older stable
         self.plugin._installed_version = '22.10.1a1'
@@ -140,9 +259,1508 @@ class PluginTests(unittest.TestCase):
         self.assertEqual(resp.data['new_version'], '22.10.0')
         self.assertEqual(resp.data['latest_version'], '22.10.0')
 
+        # Backported release is not newer than the installed version
+        self.plugin._get_github_releases = Mock(
+            return_value=['22.04.2', '22.10.4a1', '22.10.3'])
+        self.plugin._installed_version = '22.10.3'
+        resp = self.bus.wait_for_response(Message(
+            "neon.core_updater.check_update", {"channel": "beta"}))
+        self.assertIsNone(resp.data['new_version'])
+        self.assertEqual(resp.data['latest_version'], '22.10.3')
+        self.assertEqual(resp.data['channel'], 'beta')
+
         self.plugin._get_github_releases = real_get_releases
         self.plugin._get_latest_github_release = real_get_latest
 
+    def test_check_core_updates_remote_error(self):
+        server = StubServer()
+        server.routes["/repos/test/repo/releases/latest"] = (
+            403, {"X-RateLimit-Remaining": "0"}, b'{"message": "limited"}')
+        bus = FakeBus()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "github_ref": "test/repo", "github_api_url": server.url,
+            "http_retries": 0})
+        try:
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.check_update"))
+            self.assertIsInstance(resp, Message)
+            self.assertIsNone(resp.data["new_version"])
+            self.assertIsNone(resp.data["latest_version"])
+            self.assertIn("403", resp.data["error"])
+            self.assertEqual(plugin.metrics.to_dict()["counters"]
+                             ["update_check_errors"], 1)
+        finally:
+            plugin.shutdown()
+            server.shutdown()
+
+    def test_check_core_updates_coalesced(self):
+        real_get_releases = self.plugin._get_github_releases
+        self.plugin._installed_version = "22.04.0"
+        started = Event()
+        release = Event()
+
+        def _get_releases():
+            started.set()
+            release.wait(5)
+            return ['22.10.0', '22.04.0']
+
+        self.plugin._get_github_releases = Mock(side_effect=_get_releases)
+        responses = list()
+        coalesced = self.plugin._check_flight.coalesced
+        counted = self.plugin.metrics.to_dict()["counters"].get(
+            "update_checks_coalesced", 0)
+
+        def _check():
+            responses.append(self.bus.wait_for_response(Message(
+                "neon.core_updater.check_update",
+                {"include_prerelease": True}), timeout=5))
+
+        threads = [Thread(target=_check) for _ in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for t in threads[1:]:
+            t.start()
+        while self.plugin._check_flight.coalesced < coalesced + 4:
+            sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.plugin._get_github_releases.assert_called_once()
+        self.assertEqual(len(responses), 5)
+        for resp in responses:
+            self.assertIsInstance(resp, Message)
+            self.assertEqual(resp.data['new_version'], '22.10.0')
+        # Only the requests that waited on the leader are counted
+        self.assertEqual(self.plugin.metrics.to_dict()["counters"]
+                         ["update_checks_coalesced"], counted + 4)
+        self.plugin._get_github_releases = real_get_releases
+
+    def test_start_core_updates(self):
+        progress = list()
+        done = Event()
+
+        def _on_progress(msg):
+            progress.append(msg)
+            if msg.data["stage"] is None:
+                done.set()
+
+        def _on_update_config(msg):
+            self.bus.emit(msg.response())
+
+        self.bus.on("neon.core_updater.progress", _on_progress)
+        self.bus.on("neon.update_config", _on_update_config)
+        self.plugin.update_command = None
+        resp = self.bus.wait_for_response(Message(
+            "neon.core_updater.start_update", {"version": "22.10.1a1"}))
+        self.assertIsInstance(resp, Message)
+        self.assertIsInstance(resp.data["job_id"], str)
+        self.assertEqual(resp.data["version"], "22.10.1a1")
+
+        self.assertTrue(done.wait(5))
+        self.bus.remove("neon.core_updater.progress", _on_progress)
+        self.bus.remove("neon.update_config", _on_update_config)
+        for msg in progress:
+            self.assertEqual(msg.data["job_id"], resp.data["job_id"])
+        stages = [(m.data["stage"], m.data["status"]) for m in progress]
+        self.assertEqual(stages, [("fetch_patch", "started"),
+                                  ("fetch_patch", "skipped"),
+                                  ("run_patch", "started"),
+                                  ("run_patch", "skipped"),
+                                  ("update_config", "started"),
+                                  ("update_config", "completed"),
+                                  ("write_versions", "started"),
+                                  ("write_versions", "skipped"),
+                                  ("launch_update", "started"),
+                                  ("launch_update", "skipped"),
+                                  # No update command is configured
+                                  (None, "failed")])
+        for msg in progress:
+            if msg.data["status"] != "started":
+                self.assertIsInstance(msg.data["duration"], float)
+
+    def test_get_pypi_releases(self):
+        server = StubServer()
+        server.routes["/pypi/neon-core/json"] = (200, {}, json.dumps({
+            "releases": {
+                "22.10.0": [{"upload_time_iso_8601": "2022-10-01T00:00:00Z"}],
+                "22.10.1a1": [{"upload_time_iso_8601": "2022-10-05T00:00:00Z"},
+                              {"upload_time_iso_8601": "2022-10-06T00:00:00Z"}],
+                "22.04.0": [{"upload_time_iso_8601": "2022-04-01T00:00:00Z"}],
+                "22.10.2a1": [{"upload_time_iso_8601": "2022-10-07T00:00:00Z",
+                               "yanked": True}],
+                "22.10.3": []}}).encode())
+        server.routes["/simple/neon-core/"] = (200, {}, json.dumps({
+            "files": [
+                {"filename": "neon_core-22.10.0-py3-none-any.whl",
+                 "upload-time": "2022-10-01T00:00:00Z"},
+                {"filename": "neon-core-22.10.0.tar.gz",
+                 "upload-time": "2022-10-01T00:00:00Z"},
+                {"filename": "neon_core-22.10.1a1-py3-none-any.whl",
+                 "upload-time": "2022-10-05T00:00:00Z"},
+                {"filename": "neon_core-22.04.0-py3-none-any.whl",
+                 "upload-time": "2022-04-01T00:00:00Z"},
+                {"filename": "neon_core-22.10.2a1-py3-none-any.whl",
+                 "upload-time": "2022-10-07T00:00:00Z", "yanked": "broken"}
+            ]}).encode())
+        plugin = CoreUpdater(FakeBus(), config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "pypi_ref": "neon-core", "pypi_index_url": server.url})
+        try:
+            expected = ["22.10.1a1", "22.10.0", "22.04.0"]
+            self.assertEqual(plugin._get_pypi_releases(), expected)
+            plugin.config["pypi_api"] = "simple"
+            self.assertEqual(plugin._get_pypi_releases(), expected)
+            self.assertEqual(server.requests[-1][1]["Accept"],
+                             "application/vnd.pypi.simple.v1+json")
+
+            # Results are cached
+            self.assertEqual(plugin._get_pypi_releases(), expected)
+            self.assertEqual(len(server.requests), 2)
+
+            plugin._installed_version = "22.04.0"
+            resp = plugin.bus.wait_for_response(Message(
+                "neon.core_updater.check_update"))
+            self.assertEqual(resp.data["new_version"], "22.10.0")
+            self.assertEqual(resp.data["pypi_ref"], "neon-core")
+        finally:
+            plugin.shutdown()
+            server.shutdown()
+
+    def test_stage_fetch_patch(self):
+        server = StubServer()
+        script = b"#!/bin/sh\necho patched"
+        server.routes["/dev/patch.sh"] = (200, {}, script)
+        server.routes["/dev/patch.sh.sha256"] = (
+            200, {}, f"{hashlib.sha256(script).hexdigest()}  patch.sh".encode())
+        self.plugin.patch_script = f"{server.url}/{{}}/patch.sh"
+        self.plugin.config["patch_script_sha256_url"] = \
+            f"{server.url}/{{}}/patch.sh.sha256"
+        job = UpdateJob("22.10.1a1", Message("test"))
+        try:
+            # Falls back to the default branch
+            self.assertTrue(self.plugin._stage_fetch_patch(job))
+            self.assertEqual(job.patch_ver, "dev")
+            with open(job.patch_path, 'rb') as f:
+                self.assertEqual(f.read(), script)
+            self.assertTrue(os.access(job.patch_path, os.X_OK))
+            os.remove(job.patch_path)
+
+            # Digest mismatch
+            self.plugin.config["patch_script_sha256"] = "0" * 64
+            with self.assertRaises(ValueError):
+                self.plugin._stage_fetch_patch(UpdateJob("22.10.1a1",
+                                                         Message("test")))
+        finally:
+            self.plugin.patch_script = None
+            self.plugin.config.pop("patch_script_sha256", None)
+            self.plugin.config.pop("patch_script_sha256_url", None)
+            server.shutdown()
+
+
+class ReleaseIndexTests(unittest.TestCase):
+    server = StubServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def _set_releases(self, releases, per_page=2):
+        base = "/repos/test/repo/releases"
+        self.server.routes.clear()
+        for page in range(0, len(releases), per_page):
+            path = f"{base}?per_page={per_page}" if page == 0 else \
+                f"{base}?per_page={per_page}&page={page // per_page + 1}"
+            headers = {"ETag": f'"{len(releases)}"'}
+            if page + per_page < len(releases):
+                headers["Link"] = f'<{self.server.url}{base}?' \
+                                  f'per_page={per_page}&page=' \
+                                  f'{page // per_page + 2}>; rel="next"'
+            body = json.dumps(releases[page:page + per_page]).encode()
+
+            def _respond(handler, headers=headers, body=body):
+                if handler.headers.get("If-None-Match") == headers["ETag"]:
+                    return 304, {}, b""
+                return 200, headers, body
+            self.server.routes[path] = (200, {}, _respond)
+
+    @staticmethod
+    def _release(idx, tag):
+        return {"id": idx, "tag_name": tag, "prerelease": 'a' in tag,
+                "created_at": f"2022-10-{idx:02d}T00:00:00Z",
+                "body": "Release notes", "assets": []}
+
+    def test_incremental_refresh(self):
+        releases = [self._release(5, "22.10.3"), self._release(4, "22.10.2"),
+                    self._release(3, "22.10.2a1"),
+                    self._release(2, "22.10.1"), self._release(1, "22.10.0")]
+        self._set_releases(releases)
+        path = join(mkdtemp(), "index.json")
+        index = GitHubReleaseIndex("test/repo", path, api_url=self.server.url,
+                                   per_page=2, ttl=0)
+        tags = [r["tag_name"] for r in index.get_releases()]
+        self.assertEqual(tags, [r["tag_name"] for r in releases])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertNotIn("body", index.releases[0])
+
+        # No new releases
+        self.server.requests.clear()
+        self.assertEqual(len(index.get_releases()), 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn("If-None-Match", self.server.requests[0][1])
+        counters = index.metrics.to_dict()["counters"]
+        self.assertEqual(counters["index_misses"], 2)
+        self.assertEqual(counters["index_revalidated"], 1)
+        self.assertNotIn("cache_misses", counters)
+
+        # New release only fetches the first page
+        self.server.requests.clear()
+        self._set_releases([self._release(6, "22.11.0a1")] + releases)
+        index = GitHubReleaseIndex("test/repo", path, api_url=self.server.url,
+                                   per_page=2, ttl=0)
+        self.assertEqual(len(index.releases), 5)
+        tags = [r["tag_name"] for r in index.get_releases()]
+        self.assertEqual(tags[0], "22.11.0a1")
+        self.assertEqual(len(tags), 6)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_deleted_and_edited_releases(self):
+        releases = [self._release(5, "22.10.3"), self._release(4, "22.10.2"),
+                    self._release(3, "22.10.2a1"),
+                    self._release(2, "22.10.1"), self._release(1, "22.10.0")]
+        self._set_releases(releases)
+        index = GitHubReleaseIndex("test/repo", None, api_url=self.server.url,
+                                   per_page=2, ttl=0)
+        self.assertEqual(len(index.get_releases()), 5)
+
+        # Newest release is deleted and the next one is marked prerelease
+        edited = dict(releases[1], prerelease=True)
+        self._set_releases([edited] + releases[2:])
+        self.server.requests.clear()
+        updated = index.get_releases()
+        self.assertEqual([r["tag_name"] for r in updated],
+                         ["22.10.2", "22.10.2a1", "22.10.1", "22.10.0"])
+        self.assertTrue(updated[0]["prerelease"])
+        self.assertEqual(len(self.server.requests), 1)
+
+        # All releases fit on the first page
+        self._set_releases(releases[3:], per_page=100)
+        index.per_page = 100
+        self.assertEqual([r["tag_name"] for r in index.get_releases()],
+                         ["22.10.1", "22.10.0"])
+
+    def test_refresh_error(self):
+        index = GitHubReleaseIndex("test/repo", None, api_url=self.server.url,
+                                   ttl=0)
+        self.server.routes.clear()
+        with self.assertRaises(Exception):
+            index.get_releases()
+        self._set_releases([self._release(1, "22.10.0")], per_page=100)
+        self.assertEqual(len(index.get_releases()), 1)
+        self.server.routes.clear()
+        self.assertEqual(len(index.get_releases()), 1)
+
+
+class ReleaseMirrorTests(unittest.TestCase):
+    def setUp(self):
+        self.upstream = StubServer()
+        self.mirror = ReleaseMirror("127.0.0.1", 0, self.upstream.url,
+                                    self.upstream.url, ttl=60,
+                                    github_refs=("a/b", "test/repo"))
+        self.mirror.start()
+        self.url = f"http://127.0.0.1:{self.mirror.port}"
+
+    def tearDown(self):
+        self.mirror.shutdown()
+        self.upstream.shutdown()
+
+    def test_get_upstream_url(self):
+        self.assertEqual(self.mirror.get_upstream_url(
+            "/repos/a/b/releases?per_page=100"),
+            f"{self.upstream.url}/repos/a/b/releases?per_page=100")
+        self.assertEqual(self.mirror.get_upstream_url("/repos/A/B"),
+                         f"{self.upstream.url}/repos/A/B")
+        # Only configured repositories are proxied
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/repos/a/private/releases"))
+        self.assertIsNone(self.mirror.get_upstream_url("/repos/a"))
+        self.assertIsNone(self.mirror.get_upstream_url("/repos/a/b2/tags"))
+        # Dot segments could escape the allowed repositories
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/repos/a/b/../../evil/private/releases"))
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/repos/a/b/%2e%2e/%2E%2E/evil/private/releases"))
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/repos/a/b/./releases"))
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/raw/raw.githubusercontent.com/../evil.com/patch.sh"))
+        self.assertEqual(requests.get(
+            f"{self.url}/repos/a/b/%2e%2e/%2e%2e/evil/private/releases")
+            .status_code, 404)
+        self.assertEqual(self.upstream.requests, [])
+        self.assertEqual(self.mirror.get_upstream_url("/pypi/neon-core/json"),
+                         f"{self.upstream.url}/pypi/neon-core/json")
+        self.assertEqual(self.mirror.get_upstream_url(
+            "/raw/raw.githubusercontent.com/a/b/dev/patch.sh"),
+            "https://raw.githubusercontent.com/a/b/dev/patch.sh")
+        self.assertIsNone(self.mirror.get_upstream_url(
+            "/raw/example.com/patch.sh"))
+        self.assertIsNone(self.mirror.get_upstream_url("/other"))
+
+    def test_devices_share_upstream_requests(self):
+        releases = [{"id": i, "tag_name": f"22.10.{i}",
+                     "created_at": f"2022-10-{i + 1:02d}T00:00:00Z"}
+                    for i in range(3, -1, -1)]
+        base = "/repos/test/repo/releases"
+        self.upstream.routes[f"{base}?per_page=2"] = (
+            200, {"Link": f'<{self.upstream.url}{base}?per_page=2&page=2>; '
+                          f'rel="next"'}, json.dumps(releases[:2]).encode())
+        self.upstream.routes[f"{base}?per_page=2&page=2"] = (
+            200, {}, json.dumps(releases[2:]).encode())
+        for _ in range(5):
+            index = GitHubReleaseIndex("test/repo", None, api_url=self.url,
+                                       per_page=2, ttl=0)
+            self.assertEqual([r["tag_name"] for r in index.get_releases()],
+                             [r["tag_name"] for r in releases])
+        self.assertEqual(len(self.upstream.requests), 2)
+
+        # Not found responses are cached
+        for _ in range(3):
+            resp = requests.get(f"{self.url}/pypi/missing/json")
+            self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(self.upstream.requests), 3)
+        self.assertEqual(requests.get(f"{self.url}/other").status_code, 404)
+
+    def test_cache_size(self):
+        self.mirror.max_entries = 2
+        for name in ("a", "b", "a", "c"):
+            resp = requests.get(f"{self.url}/pypi/{name}/json?q={name}")
+            self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(self.upstream.requests), 3)
+        # Least recently used response is evicted
+        self.assertEqual([k[0].split('?')[0] for k in self.mirror._cache],
+                         [f"{self.upstream.url}/pypi/a/json",
+                          f"{self.upstream.url}/pypi/c/json"])
+        self.assertEqual(self.mirror.metrics.to_dict()["counters"]
+                         ["cache_evictions"], 1)
+
+    def test_conditional_and_stale(self):
+        self.upstream.routes["/pypi/neon-core/json"] = (
+            200, {"Content-Type": "application/json"}, b'{"releases": {}}')
+        url = f"{self.url}/pypi/neon-core/json"
+        resp = requests.get(url)
+        self.assertEqual(resp.json(), {"releases": {}})
+        self.assertEqual(resp.headers["Content-Type"], "application/json")
+        etag = resp.headers["ETag"]
+        resp = requests.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+
+        # Upstream errors serve stale data
+        self.mirror.ttl = 0
+        self.mirror.http.max_retries = 0
+        self.upstream.routes["/pypi/neon-core/json"] = (503, {}, b"")
+        resp = requests.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"releases": {}})
+
+        # Upstream errors without cached data
+        self.upstream.routes["/pypi/other/json"] = (503, {}, b"")
+        self.assertEqual(requests.get(f"{self.url}/pypi/other/json")
+                         .status_code, 503)
+
+
+class DownloadTests(unittest.TestCase):
+    server = StubServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_download_file(self):
+        content = b"0123456789" * 1000
+        digest = hashlib.sha256(content).hexdigest()
+        self.server.routes["/file"] = (200, {}, content)
+        url = f"{self.server.url}/file"
+        path = download_file(url, 10000, digest)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        os.remove(path)
+
+        with self.assertRaises(ValueError):
+            download_file(url, 9999)
+        with self.assertRaises(ValueError):
+            download_file(url, 10000, "0" * 64)
+        self.server.routes["/missing"] = (404, {}, b"")
+        with self.assertRaises(Exception):
+            download_file(f"{self.server.url}/missing", 10000)
+
+    def test_get_remote_digest(self):
+        self.server.routes["/digest"] = (200, {}, b"ABC123  file.sh\n")
+        self.assertEqual(get_remote_digest(f"{self.server.url}/digest"),
+                         "abc123")
+        self.server.routes["/empty"] = (200, {}, b"")
+        with self.assertRaises(ValueError):
+            get_remote_digest(f"{self.server.url}/empty")
+
+
+class HttpClientTests(unittest.TestCase):
+    server = StubServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def test_retry(self):
+        responses = [(503, {}, b""), (429, {"Retry-After": "0"}, b""),
+                     (200, {}, b"ok")]
+        self.server.routes["/retry"] = (200, {}, lambda _: responses.pop(0))
+        client = HttpClient(max_retries=2, backoff=0.01)
+        resp = client.get(f"{self.server.url}/retry")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+        # Retries are bounded
+        self.server.requests.clear()
+        self.server.routes["/error"] = (500, {}, b"")
+        resp = client.get(f"{self.server.url}/error")
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+        # Client errors are not retried
+        self.server.requests.clear()
+        resp = client.get(f"{self.server.url}/missing")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_rate_limit(self):
+        client = HttpClient(max_retries=2, backoff=0.01, max_retry_wait=10)
+        self.server.routes["/limited"] = (
+            403, {"X-RateLimit-Remaining": "0",
+                  "X-RateLimit-Reset": str(int(time()) + 3600)}, b"")
+        resp = client.get(f"{self.server.url}/limited")
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertGreater(client.get_retry_delay(resp, 0), 3000)
+
+        self.server.requests.clear()
+        self.server.routes["/retry_after"] = (429, {"Retry-After": "60"}, b"")
+        resp = client.get(f"{self.server.url}/retry_after")
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(client.get_retry_delay(resp, 0), 60)
+
+    def test_auth_token(self):
+        self.server.routes["/auth"] = (200, {}, b"")
+        HttpClient(auth_token="token").get(f"{self.server.url}/auth")
+        self.assertNotIn("Authorization", self.server.requests[0][1])
+        HttpClient(auth_token="token", auth_hosts=("127.0.0.1",)).get(
+            f"{self.server.url}/auth")
+        self.assertEqual(self.server.requests[1][1]["Authorization"],
+                         "Bearer token")
+
+    def test_timeout(self):
+        def _slow(_):
+            sleep(0.5)
+            return 200, {}, b""
+
+        self.server.routes["/slow"] = (200, {}, _slow)
+        client = HttpClient(timeout=(1, 0.1), max_retries=1, backoff=0.01)
+        with self.assertRaises(Exception):
+            client.get(f"{self.server.url}/slow")
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class VersionTests(unittest.TestCase):
+    def test_parse_version(self):
+        for version, expected in (("22.10.1", (22, 10, 1)),
+                                  ("v23.1.0", (23, 1, 0)),
+                                  ("V23.1.0a2", (23, 1, 0)),
+                                  ("22.04.1a1", (22, 4, 1)),
+                                  ("not-a-version", None),
+                                  ("", None),
+                                  (None, None)):
+            parsed = parse_version(version)
+            self.assertEqual(parsed.release if parsed else None, expected,
+                             version)
+
+    def test_parse_pin(self):
+        for pin, version, expected in (("23.x", "23.4.1", True),
+                                       ("23.x", "24.0.0", False),
+                                       ("23.*", "23.0.0a1", True),
+                                       ("23.04.x", "23.4.2", True),
+                                       ("23.04.x", "23.5.0", False),
+                                       ("~=23.1", "23.9.0", True),
+                                       ("~=23.1", "24.0.0", False),
+                                       (">=23,<23.6", "23.5.9", True)):
+            self.assertEqual(parse_pin(pin).contains(
+                parse_version(version), prereleases=True), expected, pin)
+        self.assertIsNone(parse_pin(""))
+        self.assertIsNone(parse_pin("not a pin"))
+
+    def test_is_allowed(self):
+        for version, channel, expected in (("23.1.0", "stable", True),
+                                           ("23.1.0a1", "stable", False),
+                                           ("23.1.0rc1", "stable", False),
+                                           ("23.1.0.dev1", "stable", False),
+                                           ("23.1.0", "beta", True),
+                                           ("23.1.0b1", "beta", True),
+                                           ("23.1.0rc1", "beta", True),
+                                           ("23.1.0a1", "beta", False),
+                                           ("23.1.0.dev1", "beta", False),
+                                           ("23.1.0a1", "alpha", True),
+                                           ("23.1.0.dev1", "alpha", True),
+                                           ("23.1.0.post1", "stable", True)):
+            self.assertEqual(is_allowed(parse_version(version), channel),
+                             expected, f"{version}|{channel}")
+
+    def test_select_update(self):
+        releases = ["23.4.0a3", "v23.3.1", "23.3.0", "22.10.5", "23.3.1rc1",
+                    "23.3.0a7", "23.3.1.dev2", "invalid", None]
+        for installed, channel, pin, expected in (
+                ("23.3.0", "stable", None, ("v23.3.1", "v23.3.1")),
+                ("23.3.1", "stable", None, (None, "v23.3.1")),
+                ("v23.3.1", "stable", None, (None, "v23.3.1")),
+                ("23.3.0", "beta", None, ("v23.3.1", "v23.3.1")),
+                ("23.3.0", "alpha", None, ("23.4.0a3", "23.4.0a3")),
+                ("23.4.0a3", "alpha", None, (None, "23.4.0a3")),
+                # Leaving a pre-release track may select an older version
+                ("23.4.0a3", "stable", None, ("v23.3.1", "v23.3.1")),
+                ("23.3.1rc1", "beta", None, ("v23.3.1", "v23.3.1")),
+                ("22.10.1", "stable", "22.x", ("22.10.5", "22.10.5")),
+                ("22.10.5", "alpha", "22.x", (None, "22.10.5")),
+                ("23.3.0", "stable", "~=23.3.0", ("v23.3.1", "v23.3.1")),
+                ("23.3.0", "stable", "24.x", (None, None)),
+                ("0.0.0", "stable", None, ("v23.3.1", "v23.3.1")),
+                ("unknown", "stable", None, ("v23.3.1", "v23.3.1"))):
+            self.assertEqual(select_update(releases, installed, channel, pin),
+                             expected, f"{installed}|{channel}|{pin}")
+        self.assertEqual(select_update([], "23.3.0"), (None, None))
+
+    def test_get_release_base(self):
+        for version, expected in (("22.10.1a1", "22.10.1"),
+                                  ("22.04.0", "22.04.0"),
+                                  ("v23.1.0rc2", "23.1.0"),
+                                  ("23.1.0.post1", "23.1.0"),
+                                  ("23.1.0.dev3", "23.1.0"),
+                                  ("master", "master")):
+            self.assertEqual(get_release_base(version), expected)
+
+
+class PrestageTests(unittest.TestCase):
+    @staticmethod
+    def _get_fake_python(exit_code: int = 0) -> str:
+        path = join(mkdtemp(), "python")
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\n'
+                    f'for arg; do spec=$arg; done\n'
+                    f'touch "$5/$(echo $spec | tr = -).whl"\n'
+                    f'exit {exit_code}\n')
+        os.chmod(path, 0o755)
+        return path
+
+    def test_get_command(self):
+        prestager = Prestager(mkdtemp(), spec="{package}[extra]=={version}",
+                              python="python3", pip_args=["--no-deps"],
+                              nice=None)
+        self.assertEqual(prestager.get_command("neon_core", "23.1.0", "dest"),
+                         ["python3", "-m", "pip", "download", "--dest",
+                          "dest", "--progress-bar", "off", "--no-deps",
+                          "neon_core[extra]==23.1.0"])
+        prestager.nice = 10
+        command = prestager.get_command("neon_core", "23.1.0", "dest")
+        self.assertEqual(command[:3], ["nice", "-n", "10"])
+
+    def test_stage(self):
+        directory = mkdtemp()
+        prestager = Prestager(directory, python=self._get_fake_python(),
+                              nice=None)
+        self.assertIsNone(prestager.get_staged_dir("23.1.0"))
+        staged = prestager.stage("neon_core", "23.1.0")
+        self.assertEqual(staged, join(directory, "23.1.0"))
+        self.assertEqual(os.listdir(staged), ["neon_core--23.1.0.whl"])
+        self.assertEqual(prestager.get_staged_dir("23.1.0"), staged)
+
+        # Newer version replaces the old one
+        staged = prestager.stage("neon_core", "23.2.0")
+        self.assertEqual(os.listdir(directory), ["23.2.0"])
+
+        # Failed staging leaves no partial files
+        prestager.python = self._get_fake_python(1)
+        self.assertIsNone(prestager.stage("neon_core", "23.3.0"))
+        self.assertEqual(os.listdir(directory), ["23.2.0"])
+
+        # Tag names are normalized
+        prestager.python = self._get_fake_python()
+        staged = prestager.stage("neon_core", "v23.4.0")
+        self.assertEqual(staged, join(directory, "23.4.0"))
+        self.assertEqual(os.listdir(staged), ["neon_core--23.4.0.whl"])
+        self.assertEqual(prestager.get_staged_dir("v23.4.0"), staged)
+
+    def test_plugin_prestage(self):
+        directory = mkdtemp()
+        output = join(mkdtemp(), "output")
+        plugin = CoreUpdater(FakeBus(), config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "prestage_updates": True, "prestage_dir": directory,
+            "prestage_python": self._get_fake_python(), "prestage_nice": None,
+            "update_command": f"echo {{}} {{staged_dir}} "
+                              f"$NEON_UPDATE_WHEEL_DIR > {output}"})
+        plugin._installed_version = "22.10.0"
+        plugin._get_latest_github_release = Mock(return_value="23.1.0")
+        try:
+            resp = plugin.bus.wait_for_response(Message(
+                "neon.core_updater.check_update"))
+            self.assertEqual(resp.data["new_version"], "23.1.0")
+            staged = join(directory, "23.1.0")
+            for _ in range(50):
+                if plugin.prestager.get_staged_dir("23.1.0"):
+                    break
+                sleep(0.1)
+            self.assertEqual(plugin.prestager.get_staged_dir("23.1.0"), staged)
+
+            plugin._stage_launch_update(UpdateJob("23.1.0", Message("test")))
+            for _ in range(50):
+                if isfile(output):
+                    break
+                sleep(0.1)
+            sleep(0.1)
+            with open(output) as f:
+                self.assertEqual(f.read().strip(),
+                                 f"23.1.0 {staged} {staged}")
+        finally:
+            plugin.shutdown()
+
+
+class MetricsTests(unittest.TestCase):
+    def test_metrics(self):
+        metrics = UpdaterMetrics(prefix="test")
+        metrics.increment("requests")
+        metrics.increment("bytes", 100)
+        metrics.set("exit_code", 0)
+        metrics.set("unset", None)
+        metrics.observe("stage", 0.5)
+        with metrics.timer("stage"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.timer("error"):
+                raise ValueError()
+        data = metrics.to_dict()
+        self.assertEqual(data["counters"], {"requests": 1, "bytes": 100})
+        self.assertEqual(data["gauges"], {"exit_code": 0, "unset": None})
+        self.assertEqual(data["timers"]["stage"]["count"], 2)
+        self.assertEqual(data["timers"]["stage"]["max"], 0.5)
+        self.assertEqual(data["timers"]["error"]["count"], 1)
+        self.assertEqual(metrics.get_timer("stage")["count"], 2)
+        self.assertIsNone(metrics.get_timer("missing"))
+
+        text = metrics.to_prometheus()
+        self.assertIn("# TYPE test_requests_total counter\n"
+                      "test_requests_total 1\n", text)
+        self.assertIn("test_exit_code 0\n", text)
+        self.assertNotIn("test_unset", text)
+        self.assertIn("test_stage_seconds_count 2\n", text)
+        self.assertIn("test_stage_seconds_max 0.5\n", text)
+
+        path = join(mkdtemp(), "metrics", "updater.prom")
+        metrics.write_prometheus(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), text)
+
+    def test_plugin_metrics(self):
+        server = StubServer()
+        server.routes["/pypi/neon-core/json"] = (200, {
+            "X-RateLimit-Remaining": "42"}, json.dumps({"releases": {
+                "22.10.0": [{"upload_time_iso_8601": "2022-10-01T00:00:00Z"}]
+            }}).encode())
+        metrics_file = join(mkdtemp(), "updater.prom")
+        bus = FakeBus()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "pypi_ref": "neon-core", "pypi_index_url": server.url,
+            "metrics_file": metrics_file})
+        try:
+            for _ in range(2):
+                bus.wait_for_response(Message(
+                    "neon.core_updater.check_update"))
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.get_metrics"))
+            metrics = resp.data["metrics"]
+            self.assertEqual(metrics["counters"]["update_checks"], 2)
+            self.assertEqual(metrics["counters"]["http_requests"], 1)
+            self.assertEqual(metrics["counters"]["cache_misses"], 1)
+            self.assertEqual(metrics["counters"]["cache_hits"], 1)
+            self.assertGreater(metrics["counters"]["http_bytes"], 0)
+            self.assertEqual(metrics["gauges"]["rate_limit_remaining"], 42)
+            self.assertEqual(metrics["timers"]["update_check"]["count"], 2)
+            self.assertEqual(metrics["timers"]["http_request"]["count"], 1)
+            self.assertTrue(isfile(metrics_file))
+        finally:
+            plugin.shutdown()
+            server.shutdown()
+
+
+class SchedulerTests(unittest.TestCase):
+    def test_get_delay(self):
+        scheduler = UpdateScheduler(Mock(), 3600, jitter=0, retry_delay=60)
+        self.assertEqual(scheduler.get_delay(), 3600)
+        scheduler.failures = 1
+        self.assertEqual(scheduler.get_delay(), 60)
+        scheduler.failures = 3
+        self.assertEqual(scheduler.get_delay(), 240)
+        scheduler.failures = 10
+        self.assertEqual(scheduler.get_delay(), 3600)
+
+        scheduler = UpdateScheduler(Mock(), 100)
+        for _ in range(10):
+            self.assertTrue(90 <= scheduler.get_delay() <= 110)
+
+    def test_run_backoff(self):
+        check = Mock(side_effect=[Exception("test"), Exception("test"), None,
+                                  None])
+        scheduler = UpdateScheduler(check, 0.5, jitter=0, retry_delay=0.01)
+        scheduler.start()
+        self.assertTrue(scheduler.running)
+        while check.call_count < 3:
+            sleep(0.01)
+        self.assertEqual(scheduler.failures, 0)
+        scheduler.stop()
+        self.assertFalse(scheduler.running)
+        self.assertEqual(check.call_count, 3)
+
+    def test_plugin_scheduled_checks(self):
+        bus = FakeBus()
+        available = list()
+        bus.on("neon.core_updater.update_available", available.append)
+        result = {"new_version": "22.10.0", "latest_version": "22.10.0"}
+        with patch.object(CoreUpdater, "_check_for_updates",
+                          return_value=result) as check:
+            plugin = CoreUpdater(bus, config={
+                "release_cache_path": join(mkdtemp(), "cache.json"),
+                "update_journal_path": join(mkdtemp(), "update_job.json"),
+                "check_interval": 0.05, "check_jitter": 0,
+                "check_initial_delay": 0})
+            while check.call_count < 3:
+                sleep(0.01)
+            # Event is only emitted when the result changes
+            self.assertEqual(len(available), 1)
+            self.assertEqual(available[0].data["new_version"], "22.10.0")
+
+            # Requests are answered from the scheduled result
+            plugin.scheduler.stop()
+            plugin.scheduler.interval = 60
+            calls = check.call_count
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.check_update"))
+            self.assertEqual(resp.data["new_version"], "22.10.0")
+            self.assertEqual(check.call_count, calls)
+
+            plugin.shutdown()
+            self.assertFalse(plugin.scheduler.running)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_do(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), (1, 0, True))
+        self.assertEqual(flight.coalesced, 0)
+
+        def _raise():
+            raise ValueError("test")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", _raise)
+        # Failed calls are not cached
+        self.assertEqual(flight.do("key", lambda: 2), (2, 0, True))
+
+
+class UpdateJournalTests(unittest.TestCase):
+    def test_save_load_clear(self):
+        journal = UpdateJournal(join(mkdtemp(), "core_updater", "job.json"))
+        self.assertIsNone(journal.load())
+        job = UpdateJob("22.10.1a1", Message("neon.core_updater.start_update",
+                                             {"version": "22.10.1a1"},
+                                             {"source": "test"}))
+        job.stages["fetch_patch"] = {"status": "completed", "duration": 1.0}
+        journal.save(job.to_dict())
+        self.assertEqual(os.listdir(os.path.dirname(journal.path)),
+                         ["job.json"])
+        restored = UpdateJob.from_dict(journal.load())
+        self.assertEqual(restored.to_dict(), job.to_dict())
+        self.assertTrue(restored.is_done("fetch_patch"))
+        self.assertFalse(restored.is_done("run_patch"))
+        self.assertEqual(restored.message.context, {"source": "test"})
+
+        with open(journal.path, 'w') as f:
+            f.write('{"job_id":')
+        self.assertIsNone(journal.load())
+        journal.clear()
+        self.assertFalse(isfile(journal.path))
+
+    def test_durations(self):
+        journal = UpdateJournal(join(mkdtemp(), "job.json"), max_durations=2)
+        self.assertEqual(journal.get_durations(), {})
+        for duration in (1.0, 2.0, 3.0):
+            journal.add_duration("full", duration)
+        journal.add_duration("config", 4.0)
+        self.assertEqual(journal.get_durations(), {"full": [2.0, 3.0],
+                                                   "config": [4.0]})
+        self.assertIsNone(journal.load())
+
+    def test_resume_interrupted_job(self):
+        journal = UpdateJournal(join(mkdtemp(), "job.json"))
+        job = UpdateJob("22.10.1a1", Message("neon.core_updater.start_update"))
+        job.status = "running"
+        job.plan = "config"
+        job.stages["update_config"] = {"status": "completed", "duration": 1.0}
+        journal.save(job.to_dict())
+
+        bus = FakeBus()
+        progress = list()
+        statuses = list()
+        done = Event()
+
+        def _on_status(msg):
+            statuses.append(msg)
+            done.set()
+
+        bus.on("neon.core_updater.progress", progress.append)
+        bus.on("neon.core_updater.update_status", _on_status)
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": journal.path})
+        try:
+            self.assertTrue(done.wait(5))
+            stages = [(m.data["stage"], m.data["status"]) for m in progress]
+            self.assertEqual(stages, [("fetch_patch", "skipped"),
+                                      ("run_patch", "skipped"),
+                                      ("write_versions", "started"),
+                                      ("write_versions", "skipped"),
+                                      ("launch_update", "skipped"),
+                                      (None, "completed")])
+            self.assertEqual(statuses[0].data["job_id"], job.job_id)
+            self.assertEqual(statuses[0].data["status"], "completed")
+            self.assertEqual(journal.load()["status"], "completed")
+            resp = bus.wait_for_response(
+                Message("neon.core_updater.get_update_status"))
+            self.assertEqual(resp.data["job"]["job_id"], job.job_id)
+        finally:
+            plugin.shutdown()
+
+    def _resume(self, job):
+        journal = UpdateJournal(join(mkdtemp(), "job.json"))
+        journal.save(job.to_dict())
+        bus = FakeBus()
+        progress = list()
+        statuses = list()
+        bus.on("neon.core_updater.progress", progress.append)
+        bus.on("neon.core_updater.update_status", statuses.append)
+        bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": journal.path,
+            "update_resume_attempts": 2})
+        try:
+            end = time() + 5
+            while not statuses and time() < end:
+                sleep(0.05)
+        finally:
+            plugin.shutdown()
+        return progress, statuses, journal.load()
+
+    def test_resume_started_patch(self):
+        job = UpdateJob("22.10.1a1", Message("neon.core_updater.start_update"))
+        job.status = "running"
+        job.plan = "patch"
+        job.stages["run_patch"] = {"status": "started"}
+        progress, statuses, journaled = self._resume(job)
+        self.assertEqual(statuses[0].data["status"], "failed")
+        self.assertEqual(journaled["stages"]["run_patch"]["status"], "failed")
+        self.assertNotIn("run_patch", [m.data["stage"] for m in progress])
+        self.assertEqual(journaled["resume_attempts"], 1)
+
+    def test_resume_attempts(self):
+        job = UpdateJob("22.10.1a1", Message("neon.core_updater.start_update"))
+        job.status = "running"
+        job.plan = "config"
+        job.resume_attempts = 2
+        progress, statuses, journaled = self._resume(job)
+        self.assertEqual(progress, [])
+        self.assertEqual(statuses[0].data["status"], "failed")
+        self.assertEqual(journaled["status"], "failed")
+
+    def test_resume_started_launch(self):
+        journal = UpdateJournal(join(mkdtemp(), "job.json"))
+        job = UpdateJob(version("packaging"),
+                        Message("neon.core_updater.start_update"))
+        job.status = "running"
+        job.plan = "full"
+        for stage in UPDATE_STAGES[:-1]:
+            job.stages[stage] = {"status": "completed", "duration": 1.0}
+        job.stages["launch_update"] = {"status": "started"}
+        journal.save(job.to_dict())
+
+        bus = FakeBus()
+        progress = list()
+        statuses = list()
+        bus.on("neon.core_updater.progress", progress.append)
+        bus.on("neon.core_updater.update_status", statuses.append)
+        out_dir = mkdtemp()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": journal.path,
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "update_command": f"touch {out_dir}/launched",
+            "core_module": "packaging"})
+        try:
+            end = time() + 5
+            while not statuses and time() < end:
+                sleep(0.05)
+            self.assertEqual(statuses[0].data["status"], "completed")
+            self.assertEqual(progress, [])
+            self.assertEqual(os.listdir(out_dir), [])
+        finally:
+            plugin.shutdown()
+
+    def test_update_command_exit(self):
+        bus = FakeBus()
+        statuses = list()
+        bus.on("neon.core_updater.update_status", statuses.append)
+        bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "job.json"),
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "update_command": "true", "core_module": "packaging"})
+        try:
+            job = UpdateJob(version("packaging"),
+                            Message("neon.core_updater.start_update"))
+            job.plan = "full"
+            plugin._active_job = job
+            plugin._update_executor.submit(plugin._run_update_job, job)
+            end = time() + 5
+            while plugin._active_job and time() < end:
+                sleep(0.05)
+            self.assertIsNone(plugin._active_job)
+            self.assertEqual(statuses[0].data["status"], "completed")
+            self.assertEqual(plugin.journal.load()["status"], "completed")
+            self.assertIn("update_total",
+                          plugin.metrics.to_dict()["timers"])
+        finally:
+            plugin.shutdown()
+
+    def test_failed_patch(self):
+        server = StubServer()
+        bus = FakeBus()
+        statuses = list()
+        bus.on("neon.core_updater.update_status", statuses.append)
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "job.json"),
+            "patch_script": f"{server.url}/{{}}/patch.sh",
+            "core_module": "packaging"})
+        installed = version("packaging")
+        try:
+            for code in (3, 0):
+                statuses.clear()
+                server.routes[f"/{installed}/patch.sh"] = (
+                    200, {}, f"#!/bin/sh\nexit {code}\n".encode())
+                resp = bus.wait_for_response(Message(
+                    "neon.core_updater.start_update",
+                    {"version": installed, "plan": "patch"}))
+                self.assertIsInstance(resp.data["job_id"], str)
+                end = time() + 5
+                while (not statuses or plugin._active_job) and time() < end:
+                    sleep(0.05)
+                self.assertEqual(statuses[0].data["stages"]["run_patch"]
+                                 ["status"], "failed" if code else "completed")
+                self.assertEqual(statuses[0].data["status"],
+                                 "failed" if code else "completed")
+                self.assertEqual(plugin.metrics.to_dict()["gauges"]
+                                 ["patch_exit_code"], code)
+        finally:
+            plugin.shutdown()
+            server.shutdown()
+
+    def test_launched_job_timeout(self):
+        journal = UpdateJournal(join(mkdtemp(), "job.json"))
+        job = UpdateJob("999.0.0", Message("neon.core_updater.start_update"))
+        job.status = "launched"
+        job.plan = "full"
+        journal.save(job.to_dict())
+        bus = FakeBus()
+        statuses = list()
+        bus.on("neon.core_updater.update_status", statuses.append)
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": journal.path,
+            "core_module": "packaging", "update_timeout": 0.5})
+        try:
+            # Not resolved at startup; checked again after the timeout
+            end = time() + 5
+            while not statuses and time() < end:
+                sleep(0.05)
+            self.assertEqual(statuses[0].data["status"], "failed")
+            self.assertGreaterEqual(statuses[0].data["finished"],
+                                    job.requested + 0.5)
+            self.assertEqual(journal.load()["status"], "failed")
+        finally:
+            plugin.shutdown()
+
+    def test_job_result(self):
+        job = UpdateJob("22.10.1", Message("neon.core_updater.start_update"))
+        job.plan = "full"
+        for stage in UPDATE_STAGES:
+            job.stages[stage] = {"status": "completed", "duration": 1.0}
+        self.assertEqual(CoreUpdater._get_job_result(job), "launched")
+        job.stages["fetch_patch"]["status"] = "skipped"
+        self.assertEqual(CoreUpdater._get_job_result(job), "launched")
+        job.stages["launch_update"]["status"] = "skipped"
+        self.assertEqual(CoreUpdater._get_job_result(job), "failed")
+        job.plan = "config"
+        self.assertEqual(CoreUpdater._get_job_result(job), "completed")
+        job.stages["update_config"]["status"] = "failed"
+        self.assertEqual(CoreUpdater._get_job_result(job), "failed")
+        job.cancelled = True
+        self.assertEqual(CoreUpdater._get_job_result(job), "cancelled")
+
+    def test_launched_job(self):
+        installed = version("packaging")
+        journal = UpdateJournal(join(mkdtemp(), "job.json"))
+        job = UpdateJob(installed, Message("neon.core_updater.start_update"))
+        job.requested -= 60
+        job.status = "launched"
+        for stage in UPDATE_STAGES:
+            job.stages[stage] = {"status": "completed", "duration": 1.0}
+        journal.save(job.to_dict())
+
+        bus = FakeBus()
+        done = Event()
+        statuses = list()
+
+        def _on_status(msg):
+            statuses.append(msg)
+            done.set()
+
+        bus.on("neon.core_updater.update_status", _on_status)
+        config = {"release_cache_path": join(mkdtemp(), "cache.json"),
+                  "update_journal_path": journal.path,
+                  "core_module": "packaging"}
+        plugin = CoreUpdater(bus, config=config)
+        try:
+            self.assertTrue(done.wait(5))
+            self.assertEqual(statuses[0].data["status"], "completed")
+            self.assertIsInstance(statuses[0].data["finished"], float)
+            timer = plugin.metrics.to_dict()["timers"]["update_total"]
+            self.assertGreaterEqual(timer["sum"], 60)
+        finally:
+            plugin.shutdown()
+
+        # An update that has not finished yet is left pending
+        job.version = "999.0.0"
+        job.status = "launched"
+        journal.save(job.to_dict())
+        plugin = CoreUpdater(bus, config=config)
+        try:
+            plugin._on_startup()
+            self.assertEqual(journal.load()["status"], "launched")
+            plugin.update_timeout = 30
+            plugin._on_startup()
+            self.assertEqual(journal.load()["status"], "failed")
+        finally:
+            plugin.shutdown()
+
+
+class UpdatePlannerTests(unittest.TestCase):
+    def test_normalize_requirements(self):
+        self.assertIsNone(normalize_requirements(None))
+        self.assertEqual(normalize_requirements([]), frozenset())
+        self.assertEqual(
+            normalize_requirements(["Neon_Utils ~= 1.0",
+                                    "ovos-bus-client; python_version >= '3.8'"]),
+            normalize_requirements(["neon-utils~=1.0",
+                                    'ovos_bus_client;python_version>="3.8"']))
+        self.assertNotEqual(normalize_requirements(["neon-utils~=1.0"]),
+                            normalize_requirements(["neon-utils~=1.1"]))
+
+    def test_plan_update(self):
+        reqs = ["neon-utils~=1.0"]
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a1"), "config")
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a1", patch=True),
+                         "patch")
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a3", reqs, reqs,
+                                     package_update=True), "package")
+        # Single-package updates require a configured command
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a3", reqs, reqs),
+                         "full")
+        # Changed or unknown requirements
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a3", reqs,
+                                     ["neon-utils~=1.1"],
+                                     package_update=True), "full")
+        self.assertEqual(plan_update("22.10.1a1", "22.10.1a3", reqs, None,
+                                     package_update=True), "full")
+        # Different release, downgrade, or unknown versions
+        self.assertEqual(plan_update("22.10.1a1", "22.10.2a1", reqs, reqs,
+                                     package_update=True), "full")
+        self.assertEqual(plan_update("22.10.1a3", "22.10.1a1", reqs, reqs,
+                                     package_update=True), "full")
+        self.assertEqual(plan_update("22.10.1a1", "", reqs, reqs,
+                                     package_update=True), "full")
+
+    def test_plugin_plan_update(self):
+        server = StubServer()
+        server.routes["/pypi/neon-core/json"] = (200, {}, json.dumps({
+            "releases": {
+                "22.10.1a3": [{"upload_time_iso_8601": "2022-10-03T00:00:00Z"}],
+                "22.10.1a1": [{"upload_time_iso_8601": "2022-10-01T00:00:00Z"}]
+            }}).encode())
+        server.routes["/pypi/neon-core/22.10.1a3/json"] = (200, {}, json.dumps(
+            {"info": {"requires_dist": None}}).encode())
+        server.routes["/pypi/neon-core/22.10.1a4/json"] = (200, {}, json.dumps(
+            {"info": {"requires_dist": ["neon-utils~=1.0"]}}).encode())
+        out_dir = mkdtemp()
+        bus = FakeBus()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "pypi_ref": "neon-core", "pypi_index_url": server.url,
+            "core_module": "packaging", "update_channel": "alpha",
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "update_command": f"touch {out_dir}/full-{{}}",
+            "package_update_command": f"touch {out_dir}/package-{{}}",
+            "update_estimates": {"package": 42}})
+        try:
+            plugin._installed_version = "22.10.1a1"
+            plugin._get_installed_requirements = Mock(return_value=[])
+            self.assertEqual(plugin._plan_update("22.10.1a3"), ("package", 42))
+            self.assertEqual(plugin._plan_update("22.10.1a4"), ("full", 1800))
+            # Estimates use recent completed updates with the same plan
+            plugin.journal.add_duration("full", 100)
+            plugin.journal.add_duration("full", 200)
+            self.assertEqual(plugin._plan_update("22.10.1a4"), ("full", 150))
+
+            resp = bus.wait_for_response(
+                Message("neon.core_updater.check_update"))
+            self.assertEqual(resp.data["new_version"], "22.10.1a3")
+            self.assertEqual(resp.data["update_plan"], "package")
+            self.assertEqual(resp.data["estimated_duration"], 42)
+
+            progress = list()
+            done = Event()
+
+            def _on_progress(msg):
+                progress.append(msg)
+                if msg.data["stage"] is None:
+                    done.set()
+
+            bus.on("neon.core_updater.progress", _on_progress)
+            bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+            bus.emit(Message("neon.core_updater.start_update",
+                             {"version": "22.10.1a3"}))
+            self.assertTrue(done.wait(5))
+            stages = [(m.data["stage"], m.data["status"]) for m in progress]
+            self.assertEqual(stages[:2], [("fetch_patch", "skipped"),
+                                          ("run_patch", "skipped")])
+            self.assertEqual(stages[-3:], [("launch_update", "started"),
+                                           ("launch_update", "completed"),
+                                           (None, "completed")])
+            self.assertEqual({m.data["plan"] for m in progress}, {"package"})
+            sleep(0.5)
+            self.assertEqual(os.listdir(out_dir), ["package-22.10.1a3"])
+        finally:
+            plugin.shutdown()
+            server.shutdown()
+
+
+    def test_start_update_plan_override(self):
+        bus = FakeBus()
+        progress = list()
+        bus.on("neon.core_updater.progress", progress.append)
+        bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+        out_dir = mkdtemp()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "update_command": f"touch {out_dir}/{{}}",
+            "core_module": "packaging"})
+        installed = version("packaging")
+
+        def _run_update(data):
+            progress.clear()
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.start_update", data))
+            if resp.data["job_id"]:
+                end = time() + 5
+                while (plugin._active_job or not progress or
+                       progress[-1].data["stage"] is not None) and \
+                        time() < end:
+                    sleep(0.05)
+            return resp
+
+        try:
+            # Same version only updates configuration
+            _run_update({"version": installed})
+            self.assertEqual(progress[-1].data["plan"], "config")
+            self.assertEqual(os.listdir(out_dir), [])
+
+            # Reinstall the same version
+            _run_update({"version": installed, "force": True})
+            self.assertEqual(progress[-1].data["plan"], "full")
+            self.assertEqual(os.listdir(out_dir), [installed])
+
+            _run_update({"version": installed, "plan": "patch"})
+            self.assertEqual(progress[-1].data["plan"], "patch")
+
+            resp = _run_update({"version": installed, "plan": "other"})
+            self.assertIsNone(resp.data["job_id"])
+            self.assertEqual(resp.data["error"], "invalid_plan")
+        finally:
+            plugin.shutdown()
+
+class ProcessSupervisorTests(unittest.TestCase):
+    def _wait_for(self, condition, timeout=5):
+        end = time() + timeout
+        while not condition() and time() < end:
+            sleep(0.05)
+        return condition()
+
+    def test_get_command(self):
+        self.assertEqual(with_priority(["cmd"]), ["cmd"])
+        self.assertEqual(with_priority(["cmd"], nice=10)[:3],
+                         ["nice", "-n", "10"])
+        supervisor = ProcessSupervisor()
+        self.assertEqual(supervisor.get_command("echo {}"),
+                         ["/bin/sh", "-c", "echo {}"])
+        supervisor.nice = 5
+        self.assertEqual(supervisor.get_command(["echo"]),
+                         ["nice", "-n", "5", "echo"])
+
+    def test_run_logs_output(self):
+        supervisor = ProcessSupervisor(max_line_length=8)
+        with patch("neon_phal_plugin_core_updater.supervisor.LOG") as log:
+            code = supervisor.run("echo one; echo 0123456789abcdef; exit 3",
+                                  "test")
+            self.assertEqual(code, 3)
+            expected = ["test: one", "test: 01234567", "test: 89abcdef"]
+
+            def _logged():
+                lines = [c.args[0] for c in log.info.call_args_list]
+                return all(line in lines for line in expected)
+
+            self.assertTrue(self._wait_for(_logged))
+        self.assertFalse(supervisor.running)
+        self.assertEqual(supervisor.metrics.to_dict()["counters"]
+                         ["process_test_started"], 1)
+
+    def test_run_timeout(self):
+        supervisor = ProcessSupervisor(kill_timeout=0.5)
+        start = time()
+        with self.assertRaises(TimeoutExpired):
+            # Ignores SIGTERM, so must be killed
+            supervisor.run("trap '' TERM; sleep 30", "test", timeout=0.5)
+        self.assertLess(time() - start, 5)
+        self.assertFalse(supervisor.running)
+        self.assertEqual(supervisor.metrics.to_dict()["counters"]
+                         ["process_test_timeouts"], 1)
+
+    def test_start_cancel(self):
+        supervisor = ProcessSupervisor()
+        log_path = join(mkdtemp(), "logs", "test.log")
+        codes = list()
+        supervisor.start("echo started; sleep 30", "test",
+                         log_path=log_path, on_exit=codes.append)
+        self.assertTrue(supervisor.running)
+        self.assertTrue(self._wait_for(lambda: isfile(log_path) and
+                                       open(log_path).read() == "started\n"))
+        self.assertTrue(supervisor.cancel())
+        self.assertTrue(self._wait_for(lambda: codes))
+        self.assertLess(codes[0], 0)
+        self.assertFalse(supervisor.running)
+        self.assertFalse(supervisor.cancel())
+
+    def test_cancel_does_not_block(self):
+        bus = FakeBus()
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json")})
+        try:
+            job = UpdateJob("22.10.1", Message("neon.core_updater.start_update"))
+            plugin._active_job = job
+            cancelled = Event()
+
+            def _slow_cancel():
+                sleep(2)
+                cancelled.set()
+
+            plugin.supervisor.cancel = _slow_cancel
+            start = time()
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.cancel_update"))
+            self.assertLess(time() - start, 1)
+            self.assertEqual(resp.data, {"cancelled": True,
+                                         "job_id": job.job_id})
+            self.assertTrue(job.cancelled)
+            self.assertTrue(cancelled.wait(5))
+        finally:
+            plugin.shutdown()
+
+    def test_plugin_update_lock_and_cancel(self):
+        bus = FakeBus()
+        statuses = list()
+        progress = list()
+        bus.on("neon.core_updater.update_status", statuses.append)
+        bus.on("neon.core_updater.progress", progress.append)
+        bus.on("neon.update_config", lambda m: bus.emit(m.response()))
+        plugin = CoreUpdater(bus, config={
+            "release_cache_path": join(mkdtemp(), "cache.json"),
+            "update_journal_path": join(mkdtemp(), "update_job.json"),
+            "update_log_path": join(mkdtemp(), "update.log"),
+            "update_command": "sleep 30"})
+        try:
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.start_update", {"version": "22.10.1a1"}))
+            job_id = resp.data["job_id"]
+            self.assertIsInstance(job_id, str)
+            self.assertTrue(self._wait_for(
+                lambda: progress and progress[-1].data["stage"] is None))
+            self.assertTrue(plugin.supervisor.running)
+
+            # Only one update at a time
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.start_update", {"version": "22.10.1a2"}))
+            self.assertIsNone(resp.data["job_id"])
+            self.assertEqual(resp.data["active_job_id"], job_id)
+            self.assertEqual(resp.data["error"], "update_in_progress")
+
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.cancel_update"))
+            self.assertEqual(resp.data, {"cancelled": True, "job_id": job_id})
+            self.assertTrue(self._wait_for(lambda: statuses))
+            self.assertEqual(statuses[0].data["job_id"], job_id)
+            self.assertEqual(statuses[0].data["status"], "cancelled")
+            self.assertEqual(plugin.journal.load()["status"], "cancelled")
+
+            self.assertTrue(self._wait_for(lambda: plugin._active_job is None))
+            resp = bus.wait_for_response(Message(
+                "neon.core_updater.cancel_update"))
+            self.assertEqual(resp.data, {"cancelled": False, "job_id": None})
+        finally:
+            plugin.supervisor.cancel()
+            plugin.shutdown()
+
+
+class ReleaseCacheTests(unittest.TestCase):
+    server = StubServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def test_conditional_request(self):
+        def _respond(handler):
+            if handler.headers.get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"'}, b""
+            return 200, {"ETag": '"v1"'}, json.dumps(["1.0.0"]).encode()
+
+        self.server.routes["/etag"] = (200, {}, _respond)
+        cache_file = join(mkdtemp(), "cache.json")
+        cache = ReleaseCache(cache_file, ttl=0, stale_ttl=0)
+        url = f"{self.server.url}/etag"
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+        self.assertTrue(isfile(cache_file))
+        self.assertNotIn("If-None-Match", self.server.requests[0][1])
+
+        # Expired entry is revalidated with the stored ETag
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1][1]["If-None-Match"], '"v1"')
+
+        # Validators persist across instances
+        cache = ReleaseCache(cache_file, ttl=0, stale_ttl=0)
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+        self.assertEqual(self.server.requests[2][1]["If-None-Match"], '"v1"')
+
+    def test_ttl(self):
+        self.server.routes["/ttl"] = (200, {}, b'{"tag_name": "1.0.0"}')
+        cache = ReleaseCache(None, ttl=60)
+        url = f"{self.server.url}/ttl"
+        for _ in range(3):
+            self.assertEqual(cache.get_json(url), {"tag_name": "1.0.0"})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_fallback(self):
+        self.server.routes["/stale"] = (200, {}, b'["1.0.0"]')
+        cache = ReleaseCache(None, ttl=0, stale_ttl=0)
+        url = f"{self.server.url}/stale"
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+
+        # Rate-limited response falls back to cached data
+        self.server.routes["/stale"] = (403, {"X-RateLimit-Remaining": "0"},
+                                        b'{"message": "rate limited"}')
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+
+        # No cached data to fall back to
+        self.server.routes["/uncached"] = (500, {}, b"{}")
+        with self.assertRaises(Exception):
+            cache.get_json(f"{self.server.url}/uncached")
+
+    def test_stale_while_revalidate(self):
+        self.server.routes["/swr"] = (200, {}, b'["1.0.0"]')
+        cache = ReleaseCache(None, ttl=0, stale_ttl=60)
+        url = f"{self.server.url}/swr"
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+        self.server.routes["/swr"] = (200, {}, b'["1.0.1", "1.0.0"]')
+
+        # Stale data is returned immediately and refreshed in the background
+        self.assertEqual(cache.get_json(url), ["1.0.0"])
+        for _ in range(50):
+            if cache._entries[url]["data"] != ["1.0.0"]:
+                break
+            sleep(0.1)
+        self.assertEqual(cache._entries[url]["data"], ["1.0.1", "1.0.0"])
+
+
+
+class AtomicWriteTests(unittest.TestCase):
+    def test_atomic_write(self):
+        path = join(mkdtemp(), "core_updater", "data.json")
+        atomic_write(path, "1", mode=0o644, sync=True)
+        with open(path) as f:
+            self.assertEqual(f.read(), "1")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+        # Failed writes leave the existing file and no temporary files
+        with patch("neon_phal_plugin_core_updater.util.replace",
+                   side_effect=OSError("test")):
+            with self.assertRaises(OSError):
+                atomic_write(path, "2")
+        with open(path) as f:
+            self.assertEqual(f.read(), "1")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["data.json"])
+
+        # Callers log failures instead of leaving temporary files
+        cache = ReleaseCache(join(os.path.dirname(path), "cache.json"))
+        with patch("neon_phal_plugin_core_updater.util.replace",
+                   side_effect=OSError("test")):
+            cache._entries["url"] = {"time": time(), "data": ["1.0.0"]}
+            cache._save()
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["data.json"])
+
 
 if __name__ == '__main__':
     unittest.main()